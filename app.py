@@ -1,15 +1,15 @@
 import streamlit as st
 import os
-import asyncio
-import edge_tts
-from moviepy import VideoFileClip, AudioFileClip
-from faster_whisper import WhisperModel
-from deep_translator import GoogleTranslator, DeeplTranslator
-from datetime import timedelta
-import requests
-from fpdf import FPDF
-from generate_lip_sync import generate_lip_sync_data
-from create_video import create_avatar_video
+import json
+import time
+import shutil
+from pipeline import (new_job, job_result, generate_pdf, ask_chatbot, partial_report_path, ensure_chat_index,
+                      DEFAULT_TARGETS)
+from whisper_pool import ModelRegistry
+from job_store import JobStore, JobRunner
+from tracing import start_metrics_server, summarize
+from chat_index import load_indexes
+from translation import PROVIDERS, TRANSLATION_PROVIDER
 
 # --- CONFIGURACIÓN ---
 st.set_page_config(page_title="AI Video Dubber Pro", page_icon="🎬", layout="centered")
@@ -26,226 +26,101 @@ st.markdown("""
 
 # --- FUNCIONES CORE ---
 
+# Las subidas se copian a disco de a bloques y los archivos de salida se leen recién
+# cuando alguien pide la descarga: ningún rerun carga videos enteros en memoria.
+# Las descargas no disparan un rerun (on_click="ignore")
+COPY_CHUNK_BYTES = 8 * 1024 * 1024
+
+def save_upload(uploaded_file, path):
+    uploaded_file.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(uploaded_file, f, COPY_CHUNK_BYTES)
+
+def file_payload(path):
+    # Streamlit llama a la función solo al hacer clic en el botón de descarga
+    def read():
+        with open(path, "rb") as f:
+            return f.read()
+    return read
+
+# Informe combinado y PDF: se arman una vez por conjunto de informes (st.cache_data
+# usa el hash del contenido como clave) y no en cada rerun
+@st.cache_data(show_spinner=False, max_entries=8)
+def build_combined_report(reports):
+    combined_report = "# Informe Completo de Todos los Videos\n\n"
+    for name, report_md in reports:
+        combined_report += f"## {name}\n\n{report_md}\n\n---\n\n"
+    return combined_report
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def build_combined_pdf(combined_report):
+    return generate_pdf(combined_report)
+
 @st.cache_resource
-def load_whisper():
-    # Usamos 'tiny' o 'base' para velocidad extrema. Usa 'medium' para mayor precisión.
-    # int8 para que vuele en CPU si no tienes GPU.
-    return WhisperModel("base", device="cpu", compute_type="int8")
-
-def format_timestamp(seconds):
-    td = timedelta(seconds=seconds)
-    # Formato simple para SRT: HH:MM:SS,mmm
-    total_seconds = int(td.total_seconds())
-    hours = total_seconds // 3600
-    minutes = (total_seconds % 3600) // 60
-    secs = total_seconds % 60
-    millis = int(td.microseconds / 1000)
-    return f"{hours:02}:{minutes:02}:{secs:02},{millis:03}"
-
-async def generate_voice_over(text_segments, output_audio_path):
-    # Voz neuronal de Microsoft (Español Argentino)
-    VOICE = "es-AR-TomasNeural" # Opciones: es-MX-DaliaNeural, es-ES-AlvaroNeural
-
-    full_text = " ".join([seg['text'] for seg in text_segments])
-    communicate = edge_tts.Communicate(full_text, VOICE)
-    await communicate.save(output_audio_path)
-
-def create_srt(segments, output_path):
-    with open(output_path, "w", encoding="utf-8") as f:
-        for i, seg in enumerate(segments, start=1):
-            start = format_timestamp(seg['start'])
-            end = format_timestamp(seg['end'])
-            text = seg['text']
-            f.write(f"{i}\n{start} --> {end}\n{text}\n\n")
-
-def post_process_text(text):
-    # Diccionario de reemplazos para hacer la traducción más natural en español argentino
-    # y ajustar términos específicos de cannabis, química y cultivo
-    replacements = {
-        "capullo": "cogollo",  # buds en cannabis
-        "simuladores": "milímetros",  # corrección de traducción errónea
-        "Es posible que": "Puede que",  # más natural
-        "en esta videoconferencia": "en esta charla",  # más coloquial
-        "Universidade Debaco": "Universidad Debaco",  # corrección si hay errores
-        # Agregar más según sea necesario
-    }
-    for old, new in replacements.items():
-        text = text.replace(old, new)
-    return text
-
-def generate_report(texts):
-    """Generate a structured report from the transcript texts using OpenRoute AI."""
-    # Concatenate all texts
-    full_text = ' '.join(texts)
-
-    # Configure OpenRoute
-    api_key = os.getenv('OPEN_ROUTE_API')
-    if api_key:
-        url = "https://openrouter.ai/api/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": "x-ai/grok-4.1-fast:free",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"""
-                    Basado en el siguiente transcripto de un video, genera un informe estructurado en formato Markdown.
-                    Organiza la información en secciones lógicas con títulos y subtítulos claros.
-                    Incluye un resumen al inicio.
-                    Asegúrate de que el informe sea coherente, bien estructurado y capture los puntos clave del contenido.
-                    Transcripto: {full_text}
-                    """
-                }
-            ]
-        }
-
-        try:
-            response = requests.post(url, headers=headers, json=data, timeout=30)
-            response.raise_for_status()
-            result = response.json()
-            report = result['choices'][0]['message']['content']
-        except Exception as e:
-            report = f"Error generando informe con IA: {str(e)}. Usando lógica básica.\n\n# Informe\n\n{full_text}"
-    else:
-        # Fallback to basic logic if no API key
-        report = f"# Informe del Video\n\n## Resumen\n\nResumen del contenido del video.\n\n## Contenido Completo\n\n{full_text}"
-
-    return report
-
-def generate_pdf(text):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    lines = text.split('\n')
-    for line in lines:
-        if line.startswith('# '):
-            pdf.set_font("Arial", 'B', 16)
-            pdf.multi_cell(0, 10, line[2:])
-            pdf.set_font("Arial", size=12)
-        elif line.startswith('## '):
-            pdf.set_font("Arial", 'B', 14)
-            pdf.multi_cell(0, 10, line[3:])
-            pdf.set_font("Arial", size=12)
-        elif line.strip() == '':
-            pdf.ln(10)
-        else:
-            pdf.multi_cell(0, 10, line)
-    return pdf.output(dest='S')
-
-def generate_json(original_segments, translated_segments, report_md, srt_content, video_name):
-    """Generate structured JSON from video data using Grok for professional expansion."""
-    import json
-    from datetime import datetime
-
-    # Prepare data for Grok
-    data_summary = {
-        "video_name": video_name,
-        "processing_timestamp": datetime.now().isoformat(),
-        "original_transcript": [{"start": seg.start, "end": seg.end, "text": seg.text} for seg in original_segments],
-        "translated_transcript": translated_segments,
-        "srt_content": srt_content,
-        "report_markdown": report_md
-    }
-
-    # Use Grok to structure and expand
-    api_key = os.getenv('OPEN_ROUTE_API')
-    if api_key:
-        url = "https://openrouter.ai/api/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        prompt = f"""
-        Based on the following video processing data, generate a professional, structured JSON object optimized for LLM consumption.
-        Expand the information where appropriate with additional context, key topics, entities, and structured summaries.
-        Include sections for metadata, transcripts, analysis, and expanded insights.
-
-        Data: {json.dumps(data_summary, ensure_ascii=False)}
-
-        Return only valid JSON without any markdown formatting or explanations.
-        """
-        data = {
-            "model": "x-ai/grok-4.1-fast:free",
-            "messages": [{"role": "user", "content": prompt}]
-        }
-
-        try:
-            response = requests.post(url, headers=headers, json=data, timeout=60)
-            response.raise_for_status()
-            result = response.json()
-            json_str = result['choices'][0]['message']['content'].strip()
-            # Remove any potential markdown code blocks
-            if json_str.startswith('```json'):
-                json_str = json_str[7:]
-            if json_str.endswith('```'):
-                json_str = json_str[:-3]
-            json_data = json.loads(json_str)
-        except Exception as e:
-            # Fallback to basic JSON structure
-            json_data = {
-                "error": f"Failed to generate enhanced JSON with AI: {str(e)}",
-                "fallback_data": data_summary
-            }
-    else:
-        # Fallback without API
-        json_data = {
-            "metadata": {
-                "video_name": video_name,
-                "processing_timestamp": datetime.now().isoformat(),
-                "source": "AI Video Dubber"
-            },
-            "transcripts": {
-                "original": data_summary["original_transcript"],
-                "translated": translated_segments
-            },
-            "subtitles": srt_content,
-            "report": report_md,
-            "note": "Enhanced structuring requires OPEN_ROUTE_API key"
-        }
-
-    return json.dumps(json_data, ensure_ascii=False, indent=2)
-
-def ask_chatbot(question, full_report):
-    """Ask questions about the full report using the same AI model."""
-    api_key = os.getenv('OPEN_ROUTE_API')
-    if api_key:
-        url = "https://openrouter.ai/api/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        data = {
-            "model": "x-ai/grok-4.1-fast:free",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"""
-                    Basado en el siguiente informe completo, responde a la pregunta del usuario de manera clara, concisa y precisa.
-                    Si la pregunta no está relacionada con el contenido del informe, indica que no puedes responder sobre temas fuera del informe.
-
-                    Informe completo:
-                    {full_report}
-
-                    Pregunta: {question}
-                    """
-                }
-            ]
-        }
-
-        try:
-            response = requests.post(url, headers=headers, json=data, timeout=30)
-            response.raise_for_status()
-            result = response.json()
-            answer = result['choices'][0]['message']['content']
-        except Exception as e:
-            answer = f"Error consultando al chatbot: {str(e)}. Intenta de nuevo."
-    else:
-        answer = "No se puede acceder al chatbot porque falta la clave API de OpenRoute."
-
-    return answer
+def get_model_registry():
+    # Compartido entre sesiones; precarga en segundo plano para que la primera subida no espere
+    registry = ModelRegistry()
+    registry.preload_async()
+    return registry
+
+model_registry = get_model_registry()
+
+@st.cache_resource
+def get_job_runner():
+    runner = JobRunner(JobStore(), model_registry)
+    # Si el proceso se cayó con lotes a medias, los retomamos desde la última etapa completada
+    runner.resume_all()
+    return runner
+
+job_runner = get_job_runner()
+job_store = job_runner.store
+
+@st.cache_resource
+def get_metrics_server():
+    # Endpoint /metrics de Prometheus si DOBLADO_METRICS_PORT está configurado
+    return start_metrics_server()
+
+get_metrics_server()
+
+# El chatbot es un fragmento: cada pregunta re-ejecuta solo esta sección, no los
+# resultados, el informe combinado ni los botones de descarga
+@st.fragment
+def chatbot(index_paths):
+    st.markdown("---")
+    st.markdown("### 🤖 Chatbot de Consultas sobre el Informe")
+    st.markdown("Haz preguntas sobre el contenido del informe completo generado.")
+
+    if 'chat_history' not in st.session_state:
+        st.session_state.chat_history = []
+
+    # El historial se dibuja arriba del formulario, ya con la respuesta nueva: sin rerun
+    history = st.container()
+
+    # Form for input and button
+    with st.form(key='chat_form'):
+        user_question = st.text_input("Escribe tu pregunta aquí:", key="chat_input")
+        submit_button = st.form_submit_button("Preguntar")
+
+    if submit_button and user_question.strip():
+        # Add user question to history
+        st.session_state.chat_history.append({'role': 'user', 'content': user_question})
+
+        # Get response from chatbot with spinner
+        with st.spinner("Pensando..."):
+            # Solo viajan los fragmentos relevantes: la latencia no crece con la cantidad de videos
+            chat_index = load_indexes(index_paths)
+            response = ask_chatbot(user_question, index=chat_index)
+
+        # Add response to history
+        st.session_state.chat_history.append({'role': 'assistant', 'content': response})
+
+    # Display chat history
+    with history:
+        for msg in st.session_state.chat_history:
+            if msg['role'] == 'user':
+                st.markdown(f"**Tú:** {msg['content']}")
+            else:
+                st.markdown(f"**Asistente:** {msg['content']}")
 
 # --- INTERFAZ DE USUARIO ---
 
@@ -253,207 +128,215 @@ st.title("🎬 Doblado 420")
 st.markdown("Traduce videos de **Inglés 🇺🇸** a **Español Argentino 🇦🇷** con IA. Rápido y sin coste.")
 
 deepl_api_key = st.text_input("API Key de DeepL (opcional para traducciones más naturales)", type="password")
-
-uploaded_files = st.file_uploader("Sube tus videos (MP4, MKV, MOV)", type=["mp4", "mkv", "mov"], accept_multiple_files=True)
+translator = st.selectbox(
+    "Traductor",
+    options=PROVIDERS,
+    index=PROVIDERS.index(TRANSLATION_PROVIDER) if TRANSLATION_PROVIDER in PROVIDERS else 0,
+    format_func=lambda provider: {"auto": "🌐 Automático (DeepL con API key, si no Google)", "google": "Google",
+                                  "deepl": "DeepL", "local": "💻 Modelo local (sin red)"}[provider]
+)
+
+# Cambiar la key del uploader al iniciar un lote libera las subidas de la memoria de Streamlit
+uploader_key = st.session_state.setdefault('uploader_key', 0)
+uploaded_files = st.file_uploader("Sube tus videos (MP4, MKV, MOV)", type=["mp4", "mkv", "mov"],
+                                  accept_multiple_files=True, key=f"uploader_{uploader_key}")
 
 generate_avatar = st.checkbox("🎭 Generar video de avatar animado (experimental)")
+avatar_size = None
+if generate_avatar:
+    avatar_size = st.selectbox(
+        "Formato del avatar",
+        options=[None, (1280, 720), (1080, 1080), (1080, 1920)],
+        format_func=lambda size: {None: "Tamaño de la imagen", (1280, 720): "🖥️ 720p (16:9)",
+                                  (1080, 1080): "⬛ Cuadrado (1:1)", (1080, 1920): "📱 Vertical (9:16)"}[size]
+    )
+
+accuracy_tier = st.selectbox(
+    "Precisión de la transcripción",
+    options=["rapido", "equilibrado", "preciso"],
+    index=1,
+    format_func=lambda tier: {"rapido": "⚡ Rápida", "equilibrado": "⚖️ Equilibrada", "preciso": "🎯 Precisa"}[tier]
+)
+
+# Idiomas además del español argentino: la transcripción se hace una sola vez y cada
+# idioma suma solo su traducción, su voz y su mezcla
+EXTRA_TARGETS = {
+    "🇧🇷 Portugués (Brasil)": ('pt', 'pt-BR-AntonioNeural'),
+    "🇲🇽 Español (México)": ('es', 'es-MX-JorgeNeural'),
+    "🇪🇸 Español (España)": ('es', 'es-ES-AlvaroNeural'),
+}
+extra_targets = st.multiselect("Idiomas adicionales", options=list(EXTRA_TARGETS))
+multi_audio = False
+if extra_targets:
+    multi_audio = st.checkbox("🎧 Un solo video con una pista de audio por idioma")
 
 if uploaded_files:
     if st.button("🚀 INICIAR MAGIA (Traducir & Doblar Todos)"):
-        total = len(uploaded_files)
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        st.session_state.results = []
+        batch_id = job_store.create_batch()
+        batch_dir = job_store.batch_dir(batch_id)
         for i, uploaded_file in enumerate(uploaded_files):
-            status_text.text(f"Procesando video {i+1}/{total}: {uploaded_file.name}")
-            original_name = uploaded_file.name
-            name_without_ext = os.path.splitext(original_name)[0]
-            dubbed_video_name = f"{name_without_ext} - español.mp4"
-            dubbed_srt_name = f"{name_without_ext} - español.srt"
-            dubbed_report_name = f"{name_without_ext} - informe.md"
-            temp_video_path = f"temp_video_{i}.mp4"
-            with open(temp_video_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-            try:
-                # 1. Transcripción
-                model = load_whisper()
-                segments_gen, _ = model.transcribe(temp_video_path, language="en")
-                segments = list(segments_gen)
-                # 2. Traducción
-                if deepl_api_key:
-                    translator = DeeplTranslator(api_key=deepl_api_key, source='en', target='es')
-                else:
-                    translator = GoogleTranslator(source='en', target='es')
-                translated_segments = []
-                for seg in segments:
-                    try:
-                        translated_text = translator.translate(seg.text)
-                    except Exception as e:
-                        # Try alternative translator
-                        if isinstance(translator, DeeplTranslator):
-                            alt_translator = GoogleTranslator(source='en', target='es')
-                        else:
-                            alt_translator = DeeplTranslator(api_key=deepl_api_key, source='en', target='es') if deepl_api_key else GoogleTranslator(source='en', target='es')
-                        try:
-                            translated_text = alt_translator.translate(seg.text)
-                        except Exception as e2:
-                            # If both fail, use original text
-                            translated_text = seg.text
-                    translated_text = post_process_text(translated_text)
-                    translated_segments.append({
-                        "start": seg.start,
-                        "end": seg.end,
-                        "text": translated_text
-                    })
-                # 3. Generar Subtítulos
-                srt_path = dubbed_srt_name
-                create_srt(translated_segments, srt_path)
-                # 4. Generar Audio
-                audio_output_path = f"temp_audio_es_{i}.mp3"
-                asyncio.run(generate_voice_over(translated_segments, audio_output_path))
-                # 5. Generar Avatar (opcional)
-                avatar_path = None
-                if generate_avatar:
-                    lip_sync_file = f'lip_sync_{i}.json'
-                    generate_lip_sync_data(translated_segments, lip_sync_file)
-                    avatar_video_name = f"{name_without_ext} - avatar.mp4"
-                    create_avatar_video(lip_sync_file, audio_output_path, avatar_video_name)
-                    avatar_path = avatar_video_name
-                # 6. Mezclar
-                video_clip = VideoFileClip(temp_video_path)
-                new_audio = AudioFileClip(audio_output_path)
-                if new_audio.duration > video_clip.duration:
-                    new_audio = new_audio.subclipped(0, video_clip.duration)
-                final_clip = video_clip.with_audio(new_audio)
-                final_output_path = dubbed_video_name
-                final_clip.write_videofile(final_output_path, codec="libx264", audio_codec="aac", logger=None)
-                video_clip.close()
-                new_audio.close()
-                # Generate report
-                texts = [seg['text'] for seg in translated_segments]
-                report_md = generate_report(texts)
-                # Generate JSON
-                srt_content = open(srt_path, 'r', encoding='utf-8').read()
-                json_data = generate_json(segments, translated_segments, report_md, srt_content, original_name)
-                json_name = f"{name_without_ext} - data.json"
-                # Store result
-                result = {
-                    'name': original_name,
-                    'video_path': final_output_path,
-                    'srt_path': srt_path,
-                    'report_md': report_md,
-                    'report_name': dubbed_report_name,
-                    'json_data': json_data,
-                    'json_name': json_name,
-                    'avatar_path': avatar_path
-                }
-                st.session_state.results.append(result)
-                progress_bar.progress(int((i+1)/total * 100))
-            except Exception as e:
-                st.error(f"Error procesando {original_name}: {str(e)}")
-        status_text.success("✅ ¡Todos los videos procesados!")
-        progress_bar.progress(100)
-
-    # Display results
-    if 'results' in st.session_state and st.session_state.results:
-        st.markdown("### Resultados")
-        for result in st.session_state.results:
-            st.markdown(f"#### {result['name']}")
-            col1, col2 = st.columns(2)
-            with col1:
-                with open(result['video_path'], "rb") as file:
-                    st.download_button(
-                        label="⬇️ Descargar Video Doblado",
-                        data=file,
-                        file_name=os.path.basename(result['video_path']),
-                        mime="video/mp4"
-                    )
-            with col2:
-                with open(result['srt_path'], "rb") as file:
-                    st.download_button(
-                        label="⬇️ Descargar Subtítulos (SRT)",
-                        data=file,
-                        file_name=os.path.basename(result['srt_path']),
-                        mime="text/plain"
-                    )
-            if result.get('avatar_path'):
-                with st.columns(1)[0]:
-                    with open(result['avatar_path'], "rb") as file:
-                        st.download_button(
-                            label="⬇️ Descargar Video de Avatar",
-                            data=file,
-                            file_name=os.path.basename(result['avatar_path']),
-                            mime="video/mp4"
-                        )
-            report_bytes = result['report_md'].encode('utf-8')
+            # Un directorio por video: dos subidas con el mismo nombre no se pisan las salidas
+            job_dir = os.path.join(batch_dir, f"video_{i}")
+            os.makedirs(job_dir, exist_ok=True)
+            extension = os.path.splitext(uploaded_file.name)[1] or ".mp4"
+            input_path = os.path.join(job_dir, f"input{extension}")
+            save_upload(uploaded_file, input_path)
+            job = new_job(input_path, uploaded_file.name, output_dir=job_dir, deepl_api_key=deepl_api_key,
+                          generate_avatar=generate_avatar, tag=i, accuracy_tier=accuracy_tier,
+                          avatar_size=avatar_size, translator=translator, multi_audio=multi_audio,
+                          targets=DEFAULT_TARGETS + [EXTRA_TARGETS[label] for label in extra_targets])
+            job_store.add_job(batch_id, i, job)
+        # El lote corre en segundo plano: sobrevive a reruns y a refrescos del navegador
+        job_runner.start(batch_id, secrets={'deepl_api_key': deepl_api_key})
+        st.session_state.batch_id = batch_id
+        st.query_params["lote"] = batch_id
+        st.session_state.chat_history = []
+        st.session_state.uploader_key = uploader_key + 1
+        st.rerun()
+
+# Reengancharse al lote activo (la URL conserva su id aunque se refresque la página)
+batch_id = st.session_state.get('batch_id') or st.query_params.get("lote")
+batch = job_store.batch(batch_id) if batch_id else None
+results = []
+stage_stats = None
+if batch:
+    jobs = job_store.jobs(batch_id)
+    finished = [job for job in jobs if job['status'] in ('done', 'error')]
+    if batch['status'] == 'running':
+        if not job_runner.is_running(batch_id):
+            job_runner.start(batch_id)
+        st.progress(int(len(finished) / max(1, len(jobs)) * 100))
+        for job in jobs:
+            stage = f" (última etapa: {job['stage']})" if job['stage'] else ""
+            st.text(f"{job['name']}: {job['status']}{stage}")
+            # El informe se genera en streaming: mostramos lo que ya llegó
+            partial_path = partial_report_path(job)
+            if job['status'] == 'running' and os.path.exists(partial_path):
+                with st.expander(f"📝 Informe en progreso: {job['name']}"):
+                    with open(partial_path, 'r', encoding='utf-8') as f:
+                        st.markdown(f.read())
+        # Refrescamos el progreso cada pocos segundos hasta que termine el lote
+        time.sleep(2)
+        st.rerun()
+    st.success("✅ ¡Todos los videos procesados!")
+    for job in jobs:
+        if job['status'] == 'error':
+            st.error(f"Error procesando {job['name']}: {job.get('error')}")
+        elif job['status'] == 'done':
+            ensure_chat_index(job)
+            results.append(job_result(job))
+            if job['cached']:
+                st.caption(f"♻️ {job['name']}: etapas reutilizadas del cache: {', '.join(job['cached'])}")
+    stage_stats = batch['stats']
+
+# Display results
+if results:
+    st.markdown("### Resultados")
+    if stage_stats:
+        with st.expander("⏱️ Tiempos por etapa"):
+            st.table(stage_stats)
+    for i, result in enumerate(results):
+        st.markdown(f"#### {result['name']}")
+        col1, col2 = st.columns(2)
+        with col1:
             st.download_button(
-                label="⬇️ Descargar Informe (Markdown)",
-                data=report_bytes,
-                file_name=result['report_name'],
-                mime="text/markdown"
+                label="⬇️ Descargar Video Doblado",
+                on_click="ignore",
+                data=file_payload(result['video_path']),
+                file_name=os.path.basename(result['video_path']),
+                mime="video/mp4",
+                key=f"video_{i}"
             )
-            # JSON download
-            json_bytes = result['json_data'].encode('utf-8')
+        with col2:
             st.download_button(
-                label="⬇️ Descargar Datos JSON",
-                data=json_bytes,
-                file_name=result['json_name'],
-                mime="application/json"
+                label="⬇️ Descargar Subtítulos (SRT)",
+                on_click="ignore",
+                data=file_payload(result['srt_path']),
+                file_name=os.path.basename(result['srt_path']),
+                mime="text/plain",
+                key=f"srt_{i}"
             )
-
-        # Combined report
-        st.markdown("---")
-        combined_report = "# Informe Completo de Todos los Videos\n\n"
-        for result in st.session_state.results:
-            combined_report += f"## {result['name']}\n\n{result['report_md']}\n\n---\n\n"
-        st.markdown(combined_report)
-        # Download combined MD
-        combined_md_bytes = combined_report.encode('utf-8')
+        if result.get('avatar_path'):
+            with st.columns(1)[0]:
+                st.download_button(
+                    label="⬇️ Descargar Video de Avatar",
+                    on_click="ignore",
+                    data=file_payload(result['avatar_path']),
+                    file_name=os.path.basename(result['avatar_path']),
+                    mime="video/mp4",
+                    key=f"avatar_{i}"
+                )
+        # Los demás idiomas: su video (si no van como pistas del principal) y sus subtítulos
+        for dub in result.get('dubs', []):
+            col1, col2 = st.columns(2)
+            if dub['video_path']:
+                with col1:
+                    st.download_button(
+                        label=f"⬇️ Video Doblado ({dub['target']})",
+                        on_click="ignore",
+                        data=file_payload(dub['video_path']),
+                        file_name=os.path.basename(dub['video_path']),
+                        mime="video/mp4",
+                        key=f"video_{i}_{dub['target']}"
+                    )
+            with col2:
+                st.download_button(
+                    label=f"⬇️ Subtítulos ({dub['target']})",
+                    on_click="ignore",
+                    data=file_payload(dub['srt_path']),
+                    file_name=os.path.basename(dub['srt_path']),
+                    mime="text/plain",
+                    key=f"srt_{i}_{dub['target']}"
+                )
         st.download_button(
-            label="⬇️ Descargar Informe Completo (Markdown)",
-            data=combined_md_bytes,
-            file_name="informe_completo.md",
-            mime="text/markdown"
+            label="⬇️ Descargar Informe (Markdown)",
+            on_click="ignore",
+            data=result['report_md'],
+            file_name=result['report_name'],
+            mime="text/markdown",
+            key=f"informe_{i}"
         )
-        # Generate PDF
-        combined_pdf_bytes = generate_pdf(combined_report)
+        # JSON download
         st.download_button(
-            label="⬇️ Descargar Informe Completo (PDF)",
-            data=combined_pdf_bytes,
-            file_name="informe_completo.pdf",
-            mime="application/pdf"
+            label="⬇️ Descargar Datos JSON",
+            on_click="ignore",
+            data=result['json_data'],
+            file_name=result['json_name'],
+            mime="application/json",
+            key=f"json_{i}"
         )
+        # Traza: dónde se fue el tiempo de este video (Whisper, traductor, edge-tts, ffmpeg, OpenRouter)
+        with st.expander("🔎 Traza de procesamiento"):
+            st.table(summarize(result['trace']['spans']))
+            st.download_button(
+                label="⬇️ Descargar Traza (JSON)",
+                on_click="ignore",
+                data=lambda trace=result['trace']: json.dumps(trace, ensure_ascii=False, indent=2),
+                file_name=result['trace_name'],
+                mime="application/json",
+                key=f"traza_{i}"
+            )
 
-        # --- CHATBOT SECTION ---
-        st.markdown("---")
-        st.markdown("### 🤖 Chatbot de Consultas sobre el Informe")
-        st.markdown("Haz preguntas sobre el contenido del informe completo generado.")
-
-        if 'chat_history' not in st.session_state:
-            st.session_state.chat_history = []
-
-        # Display chat history
-        for msg in st.session_state.chat_history:
-            if msg['role'] == 'user':
-                st.markdown(f"**Tú:** {msg['content']}")
-            else:
-                st.markdown(f"**Asistente:** {msg['content']}")
-
-        # Form for input and button
-        with st.form(key='chat_form'):
-            user_question = st.text_input("Escribe tu pregunta aquí:", key="chat_input")
-            submit_button = st.form_submit_button("Preguntar")
-
-        if submit_button and user_question.strip():
-            # Add user question to history
-            st.session_state.chat_history.append({'role': 'user', 'content': user_question})
-
-            # Get response from chatbot with spinner
-            with st.spinner("Pensando..."):
-                response = ask_chatbot(user_question, combined_report)
-
-            # Add response to history
-            st.session_state.chat_history.append({'role': 'assistant', 'content': response})
-
-            # Rerun to update display
-            st.rerun()
+    # Combined report
+    st.markdown("---")
+    combined_report = build_combined_report(tuple((result['name'], result['report_md']) for result in results))
+    st.markdown(combined_report)
+    # Download combined MD
+    st.download_button(
+        label="⬇️ Descargar Informe Completo (Markdown)",
+        on_click="ignore",
+        data=combined_report,
+        file_name="informe_completo.md",
+        mime="text/markdown"
+    )
+    # El PDF se genera recién cuando alguien lo pide (y queda cacheado)
+    st.download_button(
+        label="⬇️ Descargar Informe Completo (PDF)",
+        on_click="ignore",
+        data=lambda: build_combined_pdf(combined_report),
+        file_name="informe_completo.pdf",
+        mime="application/pdf"
+    )
+
+    # --- CHATBOT SECTION ---
+    chatbot([result['index_path'] for result in results])
@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+
+# Cache de artefactos direccionado por contenido: cada etapa guarda sus resultados
+# bajo una clave que combina el hash del video de entrada (o la clave de la etapa
+# anterior) con sus propios parámetros. Así una re-ejecución solo recalcula las
+# etapas cuyas entradas cambiaron. El tamaño total se acota con desalojo LRU.
+
+CACHE_DIR = os.path.join(os.getenv('DOBLADO_CACHE_DIR', '.cache'), 'artifacts')
+MAX_CACHE_MB = int(os.getenv('ARTIFACT_CACHE_MAX_MB', '20480'))
+# Cada cuánto (segundos) se vuelve a medir el cache entero; entre mediciones el tamaño
+# se estima sumando lo que guarda este proceso
+SCAN_INTERVAL = 60.0
+
+def file_digest(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def make_key(*parts):
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ArtifactCache:
+    """Stores per-stage artifacts (JSON data and files) under content-derived keys."""
+
+    def __init__(self, root=CACHE_DIR, max_bytes=MAX_CACHE_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+        self._scanned = 0.0
+        os.makedirs(self.root, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _touch(self, entry_dir):
+        # La fecha de modificación del directorio marca el último uso (LRU)
+        try:
+            os.utime(entry_dir, None)
+        except OSError:
+            pass
+
+    def get_json(self, key):
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._touch(entry_dir)
+        return meta.get('data')
+
+    def restore(self, key, name, dest):
+        """Copy the cached file ``name`` of entry ``key`` to dest; False if missing."""
+        src = os.path.join(self._entry_dir(key), name)
+        if not os.path.exists(src):
+            return False
+        # Copia y no hardlink: ffmpeg reescribe las salidas in-place y corrompería el cache
+        shutil.copyfile(src, dest)
+        self._touch(self._entry_dir(key))
+        return True
+
+    def put(self, key, data=None, files=None):
+        """Store data (JSON-serializable) and files ({name: path}) under key."""
+        entry_dir = self._entry_dir(key)
+        tmp_dir = f"{entry_dir}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(tmp_dir)
+        try:
+            for name, path in (files or {}).items():
+                shutil.copyfile(path, os.path.join(tmp_dir, name))
+            with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump({'created': time.time(), 'files': sorted(files or {}), 'data': data},
+                          f, ensure_ascii=False)
+            added = sum(os.path.getsize(os.path.join(tmp_dir, name)) for name in os.listdir(tmp_dir))
+            if os.path.exists(entry_dir):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            try:
+                os.replace(tmp_dir, entry_dir)
+            except OSError:
+                # Otro proceso guardó la misma clave entre el rmtree y el replace: su entrada vale igual
+                if not os.path.exists(os.path.join(entry_dir, 'meta.json')):
+                    raise
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        self.evict(added)
+
+    def _entries(self):
+        entries = []
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            try:
+                keys = os.listdir(prefix_dir)
+            except OSError:
+                continue
+            for key in keys:
+                entry_dir = os.path.join(prefix_dir, key)
+                if key.endswith('.tmp'):
+                    continue
+                # Otro hilo o proceso puede estar desalojando la entrada mientras se mide
+                try:
+                    size = sum(os.path.getsize(os.path.join(entry_dir, name)) for name in os.listdir(entry_dir))
+                    entries.append((os.path.getmtime(entry_dir), size, entry_dir))
+                except OSError:
+                    continue
+        return entries
+
+    def evict(self, added=0):
+        """Remove least recently used entries until the cache fits in max_bytes.
+
+        The full scan only runs when the estimated size (the last scan plus
+        the added bytes) is over the limit or the scan is SCAN_INTERVAL old.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._size is not None:
+                self._size += added
+                if self._size <= self.max_bytes and now - self._scanned < SCAN_INTERVAL:
+                    return
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry_dir in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
+            self._size, self._scanned = total, now
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_artifact_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ArtifactCache()
+        return _default_cache
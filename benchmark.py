@@ -0,0 +1,672 @@
+import os
+import sys
+import re
+import json
+import time
+import uuid
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+import subprocess
+import contextlib
+from datetime import datetime
+from types import SimpleNamespace
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Benchmarks del pipeline: python benchmark.py run / python benchmark.py compare
+# Cada etapa corre sobre fixtures generados (tono sintético, video de prueba,
+# transcripciones de N segmentos) y las etapas de red (traductores, edge-tts y
+# OpenRouter) contra servidores locales de prueba con latencia configurable.
+# Los resultados se agregan a un historial JSON y `compare` marca las regresiones.
+
+HISTORY_PATH = 'benchmark_history.json'
+DEFAULT_THRESHOLD = 0.10
+# Diferencias absolutas menores a esto (segundos) se consideran ruido
+MIN_DELTA_SECONDS = 0.005
+
+WORDS = ("the plant needs light water and nutrients during the flowering stage so we measure "
+         "temperature humidity and ph every morning before feeding the roots with a mild solution").split()
+MOUTHS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'X']
+
+class BenchmarkSkipped(Exception):
+    pass
+
+# --- FIXTURES ---
+
+def _ffmpeg(args):
+    from media import run_ffmpeg
+    run_ffmpeg(args)
+
+def make_fixtures(work_dir, segments=80, duration=60.0, seed=420):
+    """Generate the synthetic inputs every benchmark runs on."""
+    from pipeline import create_srt
+    from generate_lip_sync import merge_runs, save_lip_sync
+    rng = random.Random(seed)
+    fx = SimpleNamespace(dir=work_dir, duration=duration)
+    fx.path = lambda name: os.path.join(work_dir, name)
+
+    fx.video = fx.path('input.mp4')
+    _ffmpeg(['-f', 'lavfi', '-i', f"testsrc=size=640x360:rate=24:duration={duration}",
+             '-f', 'lavfi', '-i', f"sine=frequency=440:sample_rate=44100:duration={duration}",
+             '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p',
+             '-c:a', 'aac', '-shortest', fx.video])
+    fx.dub_audio = fx.path('dub.mp3')
+    _ffmpeg(['-f', 'lavfi', '-i', f"sine=frequency=220:sample_rate=24000:duration={duration}",
+             '-ac', '1', fx.dub_audio])
+    # Audio del tono "hablado": pulsos de 300 ms para que el VAD tenga algo que detectar
+    fx.tone = fx.path('tone.f32')
+    _ffmpeg(['-f', 'lavfi', '-i', f"sine=frequency=180:sample_rate=16000:duration={duration}",
+             '-af', "volume='if(lt(mod(t,0.6),0.3),1,0)':eval=frame",
+             '-ac', '1', '-f', 'f32le', '-acodec', 'pcm_f32le', fx.tone])
+
+    step = duration / segments
+    fx.segments = []
+    for i in range(segments):
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 16))).capitalize() + "."
+        fx.segments.append(SimpleNamespace(start=round(i * step, 3), end=round((i + 0.9) * step, 3), text=text))
+    fx.translated = [{'start': seg.start, 'end': seg.end, 'text': f"[es] {seg.text} capullo"}
+                     for seg in fx.segments]
+    fx.srt = fx.path('input.srt')
+    create_srt(fx.translated, fx.srt)
+    fx.report_md = "# Informe\n\n## Resumen\n\n" + "\n".join(
+        (f"## Parte {i // 10 + 1}\n" if i % 10 == 0 else "") + seg['text'] for i, seg in enumerate(fx.translated))
+
+    # Timeline de lip-sync sintético (no depende de espeak)
+    fx.lip_sync = fx.path('lip_sync.npz')
+    count = int(duration / 0.08)
+    codes = [rng.randrange(len(MOUTHS)) for _ in range(count)]
+    save_lip_sync(fx.lip_sync, *merge_runs([i * 0.08 for i in range(count)], [0.08] * count, codes))
+    return fx
+
+# --- SERVIDORES DE PRUEBA ---
+
+def fake_translate(text):
+    return "\n".join(f"[es] {line}" if line.strip() else line for line in text.split("\n"))
+
+# Título no ASCII de los informes del stub: si llega mal decodificado, el informe no lo contiene
+STUB_REPORT_TITLE = "Información del cultivo: ñandú"
+# Campos del cuerpo de chat/completions que el stub de OpenRouter acepta
+OPENROUTER_BODY_KEYS = {'model', 'messages', 'stream', 'temperature', 'max_tokens', 'top_p', 'response_format'}
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers like Google Translate (/m), DeepL (/v2/translate) and OpenRouter (/api/v1/chat/completions)."""
+
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body, content_type):
+        payload = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path == '/m':
+            from html import escape
+            text = fake_translate(params.get('q', [''])[0])
+            self._reply(200, f'<html><body><div class="t0">{escape(text)}</div></body></html>', 'text/html')
+        elif url.path == '/v2/translate':
+            text = fake_translate(params.get('text', [''])[0])
+            self._reply(200, json.dumps({'translations': [{'text': text}]}), 'application/json')
+        else:
+            self._reply(404, '', 'text/plain')
+
+    def do_POST(self):
+        time.sleep(self.latency)
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if urlparse(self.path).path != '/api/v1/chat/completions':
+            self._reply(404, '', 'text/plain')
+            return
+        # Las opciones del cliente (timeout, cache) no deben llegar a la API
+        extra = sorted(set(request) - OPENROUTER_BODY_KEYS)
+        if extra:
+            self._reply(400, json.dumps({'error': {'message': f"parámetros desconocidos: {extra}"}}),
+                        'application/json')
+            return
+        prompt = request['messages'][-1]['content']
+        content = f"# Informe\n\n## {STUB_REPORT_TITLE}\n\n{prompt[:2000]}"
+        if 'JSON' in prompt:
+            content = json.dumps({'summary': prompt[:2000]})
+        if request.get('stream'):
+            self._stream(content)
+            return
+        self._reply(200, json.dumps({'choices': [{'message': {'role': 'assistant', 'content': content}}]},
+                                    ensure_ascii=False), 'application/json')
+
+    def _stream(self, content):
+        # Server-sent events como OpenRouter: un chunk por cada 200 caracteres
+        self.send_response(200)
+        # Sin charset, como OpenRouter: el cliente tiene que decodificar UTF-8 igual
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        self.wfile.write(b": OPENROUTER PROCESSING\n\n")
+        for i in range(0, len(content), 200):
+            chunk = {'choices': [{'delta': {'content': content[i:i + 200]}}]}
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+def _tts_binary_message(audio):
+    headers = b"X-RequestId:bench\r\nContent-Type:audio/mpeg\r\nPath:audio"
+    return (len(headers) + 2).to_bytes(2, 'big') + headers + b"\r\n" + audio
+
+def _tts_text_message(path, body="{}"):
+    return f"X-RequestId:bench\r\nContent-Type:application/json; charset=utf-8\r\nPath:{path}\r\n\r\n{body}"
+
+def _word_boundaries(ssml, duration):
+    # Un evento WordBoundary por palabra, repartidas a lo largo del clip como lo haría edge-tts
+    match = re.search(r"<prosody[^>]*>(.*?)</prosody>", ssml, re.S)
+    words = match.group(1).split() if match else []
+    ticks = int(duration * 10_000_000 / max(1, len(words)))
+    return [{'Metadata': [{'Type': 'WordBoundary',
+                           'Data': {'Offset': i * ticks, 'Duration': ticks, 'text': {'Text': word}}}]}
+            for i, word in enumerate(words)]
+
+class StubServers:
+    """Local HTTP and websocket servers standing in for the network services."""
+
+    def __init__(self, work_dir, latency_ms=50):
+        self.latency = latency_ms / 1000.0
+        self.tts_audio_path = os.path.join(work_dir, 'stub_tts.mp3')
+        _ffmpeg(['-f', 'lavfi', '-i', "sine=frequency=300:sample_rate=24000:duration=1.2",
+                 '-ac', '1', '-b:a', '48k', self.tts_audio_path])
+        with open(self.tts_audio_path, 'rb') as f:
+            self.tts_audio = f.read()
+        self.tts_duration = 1.2
+
+    def start(self):
+        handler = type('Handler', (StubHandler,), {'latency': self.latency})
+        self.http = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.http.daemon_threads = True
+        threading.Thread(target=self.http.serve_forever, daemon=True, name="stub-http").start()
+        self.http_url = f"http://127.0.0.1:{self.http.server_address[1]}"
+
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        threading.Thread(target=self._run_ws, args=(ready,), daemon=True, name="stub-tts").start()
+        ready.wait()
+        self._patch_clients()
+        return self
+
+    def _run_ws(self, ready):
+        from aiohttp import web
+        asyncio.set_event_loop(self.loop)
+
+        async def synthesize(request):
+            ws = web.WebSocketResponse()
+            await ws.prepare(request)
+            async for message in ws:
+                # Primero llega speech.config y después el SSML: respondemos al SSML
+                if 'Path:ssml' in message.data:
+                    await asyncio.sleep(self.latency)
+                    await ws.send_str(_tts_text_message('turn.start'))
+                    for event in _word_boundaries(message.data, self.tts_duration):
+                        await ws.send_str(_tts_text_message('audio.metadata', json.dumps(event)))
+                    await ws.send_bytes(_tts_binary_message(self.tts_audio))
+                    await ws.send_str(_tts_text_message('turn.end'))
+            return ws
+
+        app = web.Application()
+        app.router.add_get('/edge/v1', synthesize)
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        self.loop.run_until_complete(site.start())
+        self.ws_url = f"ws://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/edge/v1?TrustedClientToken=bench"
+        ready.set()
+        self.loop.run_forever()
+
+    def _patch_clients(self):
+        # Los clientes reales apuntan a los servidores locales: solo cambia la URL
+        import edge_tts.communicate
+        from deep_translator.constants import BASE_URLS
+        BASE_URLS['GOOGLE_TRANSLATE'] = f"{self.http_url}/m"
+        BASE_URLS['DEEPL'] = f"{self.http_url}/{{version}}/"
+        BASE_URLS['DEEPL_FREE'] = f"{self.http_url}/{{version}}/"
+        edge_tts.communicate.WSS_URL = self.ws_url
+        os.environ['OPENROUTER_URL'] = f"{self.http_url}/api/v1/chat/completions"
+        os.environ['OPEN_ROUTE_API'] = 'bench'
+        # El servidor de prueba no limita la tasa: el token bucket no debe distorsionar los tiempos
+        os.environ['OPENROUTER_RATE_PER_MINUTE'] = '600000'
+        os.environ['OPENROUTER_BURST'] = '1000'
+
+    def stop(self):
+        self.http.shutdown()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+# --- BENCHMARKS ---
+# Cada benchmark prepara lo que necesita y devuelve la función que se cronometra.
+
+def bench_create_srt(fx):
+    from pipeline import create_srt
+    return lambda: create_srt(fx.translated, fx.path('bench.srt'))
+
+def bench_format_timestamp(fx):
+    from pipeline import format_timestamp
+    times = [seg.start for seg in fx.segments] * 50
+    return lambda: [format_timestamp(t) for t in times]
+
+def bench_post_process_text(fx):
+    from pipeline import post_process_text
+    texts = [seg['text'] for seg in fx.translated] * 20
+    return lambda: [post_process_text(text) for text in texts]
+
+def bench_glossary_large(fx):
+    # Glosario de 5000 términos: el costo por segmento no debe crecer con la cantidad
+    from glossary import get_glossary
+    rng = random.Random(7)
+    terms = {"".join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(5, 14)))
+             for _ in range(5000)}
+    path = fx.path('glosario_grande.tsv')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(f"{term}\t{term.upper()}\n" for term in sorted(terms))
+    glossary = get_glossary(path)
+    # Mayúsculas cuyo casefold cambia de largo ('İ' -> 'i̇') no deben romper la etapa
+    term = min(term for term in terms if term.startswith('i'))
+    if glossary.apply(f"İ{term[1:]}") != term.upper():
+        raise RuntimeError(f"el glosario no reemplazó 'İ{term[1:]}'")
+    texts = [seg['text'] for seg in fx.translated] * 20
+    return lambda: [glossary.apply(text) for text in texts]
+
+def bench_parse_srt(fx):
+    from generate_report import parse_srt
+    return lambda: parse_srt(fx.srt)
+
+def bench_generate_pdf(fx):
+    from pipeline import generate_pdf
+    text = fx.report_md.replace('[es] ', '')
+    return lambda: generate_pdf(text)
+
+def bench_lip_sync(fx):
+    from phonemizer.backend import EspeakBackend
+    if not EspeakBackend.is_available():
+        raise BenchmarkSkipped("espeak no está instalado")
+    from generate_lip_sync import generate_lip_sync_data
+    return lambda: generate_lip_sync_data(fx.translated, fx.path('bench_lip_sync.npz'))
+
+def bench_avatar_atlas(fx):
+    # Costo de armar el atlas en 720p cuando no está en cache (después se abre con memory-map)
+    from create_avatar import render_atlas
+    return lambda: render_atlas((1280, 720))
+
+def bench_avatar_video(fx):
+    from create_avatar import get_atlas
+    from create_video import create_avatar_video
+    # El atlas se arma una sola vez, fuera de la medición
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        get_atlas()
+
+    def run():
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            create_avatar_video(fx.lip_sync, fx.dub_audio, fx.path('bench_avatar.mp4'))
+    return run
+
+def bench_transcription(fx):
+    from whisper_pool import ModelRegistry
+    from pipeline import transcribe
+    from media import load_audio
+    try:
+        model = ModelRegistry().get(fx.whisper_model)
+    except Exception as e:
+        raise BenchmarkSkipped(f"no se pudo cargar Whisper '{fx.whisper_model}': {e}")
+    audio = load_audio(fx.tone)
+    return lambda: transcribe(model, audio)
+
+def bench_extract_audio(fx):
+    from media import extract_audio
+    return lambda: extract_audio(fx.video, fx.path('bench_audio.f32'))
+
+def bench_mux_copy(fx):
+    from media import mux_audio_copy
+    return lambda: mux_audio_copy(fx.video, fx.dub_audio, fx.path('bench_mux_copy.mp4'))
+
+def bench_mux_reencode(fx):
+    from pipeline import mux_video_reencode
+    return lambda: mux_video_reencode(fx.video, fx.dub_audio, fx.path('bench_mux_reencode.mp4'))
+
+def _bench_translate(fx, deepl_api_key, provider=None):
+    from translation import SegmentTranslator, TranslationCache
+    texts = [seg.text for seg in fx.segments]
+
+    def run():
+        # Cache nuevo en cada corrida: medimos los requests, no el cache
+        cache = TranslationCache(fx.path(f"translations-{uuid.uuid4().hex}.sqlite"))
+        translated = SegmentTranslator(deepl_api_key=deepl_api_key, cache=cache, provider=provider).translate(texts)
+        if translated[0] == texts[0]:
+            raise RuntimeError("el servidor de prueba no tradujo")
+    return run
+
+def bench_translate_google(fx):
+    return _bench_translate(fx, None)
+
+def bench_translate_deepl(fx):
+    return _bench_translate(fx, 'bench')
+
+def bench_translate_local(fx):
+    from local_translation import model_path
+    if not os.path.isdir(model_path('en', 'es')):
+        raise BenchmarkSkipped("no hay modelo de traducción local (DOBLADO_LOCAL_MT_MODEL)")
+    return _bench_translate(fx, None, provider='local')
+
+def _clear_tts_cache():
+    import tts
+    shutil.rmtree(tts.CACHE_DIR, ignore_errors=True)
+
+def bench_tts_aligned(fx):
+    from pipeline import generate_voice_over
+
+    def run():
+        _clear_tts_cache()
+        asyncio.run(generate_voice_over(fx.translated, fx.path('bench_tts_aligned.mp3'), aligned=True))
+    return run
+
+def bench_tts_single(fx):
+    from pipeline import generate_voice_over
+    return lambda: asyncio.run(generate_voice_over(fx.translated, fx.path('bench_tts_single.mp3')))
+
+def _clear_llm_cache():
+    from openrouter import get_response_cache
+    get_response_cache().clear()
+
+def _check_report(report):
+    if report.startswith("Error"):
+        raise RuntimeError("el servidor de prueba de OpenRouter no respondió")
+    if STUB_REPORT_TITLE not in report:
+        raise RuntimeError("el informe llegó mal decodificado")
+
+def bench_report(fx):
+    from pipeline import generate_report
+    texts = [seg.text for seg in fx.segments]
+
+    def run():
+        _clear_llm_cache()
+        _check_report(generate_report(texts))
+    return run
+
+def bench_report_long(fx):
+    # Transcripto 20 veces más largo: se parte en ventanas que se resumen en paralelo
+    from pipeline import generate_report
+    texts = [seg.text for seg in fx.segments] * 20
+
+    def run():
+        _clear_llm_cache()
+        _check_report(generate_report(texts, on_update=lambda markdown: None))
+    return run
+
+def bench_chatbot(fx):
+    from pipeline import ask_chatbot
+
+    def run():
+        _clear_llm_cache()
+        ask_chatbot("¿Qué temperatura se recomienda?", fx.report_md)
+    return run
+
+# Módulos que la interfaz importa al arrancar y dependencias que solo deben cargarse
+# dentro de la etapa que las usa
+APP_MODULES = ['pipeline', 'whisper_pool', 'job_store', 'tracing', 'chat_index']
+HEAVY_MODULES = ['numpy', 'requests', 'PIL', 'moviepy', 'faster_whisper', 'ctranslate2', 'edge_tts',
+                 'deep_translator', 'fpdf', 'phonemizer']
+
+def bench_import_cold(fx):
+    # Arranque en frío: un intérprete nuevo importa los módulos de la app (sin Streamlit)
+    code = (f"import sys; import {', '.join(APP_MODULES)}; "
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+
+    def run():
+        result = subprocess.run([sys.executable, '-c', code], env=env, cwd=fx.dir,
+                                capture_output=True, text=True, check=True)
+        loaded = result.stdout.strip()
+        if loaded:
+            raise RuntimeError(f"importar la app carga dependencias pesadas: {loaded}")
+    return run
+
+def bench_app_rerun(fx):
+    # Costo de cada rerun de Streamlit con un lote terminado en pantalla (resultados y chatbot)
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        raise BenchmarkSkipped("streamlit no está instalado")
+    from pipeline import new_job
+    from job_store import JobStore
+    store = JobStore()
+    batch_id = store.create_batch()
+    for i in range(2):
+        job_dir = os.path.join(store.batch_dir(batch_id), f"video_{i}")
+        os.makedirs(job_dir, exist_ok=True)
+        job = new_job(fx.video, f"bench_{i}.mp4", output_dir=job_dir, tag=i)
+        job.update(segments=fx.segments, translated_segments=fx.translated, report_md=fx.report_md,
+                   json_data="{}", avatar_path=None)
+        store.add_job(batch_id, i, job)
+        store.finish_job(job)
+    store.finish_batch(batch_id)
+    app = AppTest.from_file(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py'),
+                            default_timeout=60)
+    app.query_params['lote'] = batch_id
+    # La primera corrida (imports, cache_resource, índices del chatbot) queda fuera de la medición
+    app.run()
+
+    def run():
+        app.run()
+        if app.exception:
+            raise RuntimeError(app.exception[0].value)
+    return run
+
+BENCHMARKS = [
+    ('format_timestamp', bench_format_timestamp),
+    ('create_srt', bench_create_srt),
+    ('post_process_text', bench_post_process_text),
+    ('glossary_large', bench_glossary_large),
+    ('parse_srt', bench_parse_srt),
+    ('generate_pdf', bench_generate_pdf),
+    ('lip_sync', bench_lip_sync),
+    ('avatar_atlas', bench_avatar_atlas),
+    ('avatar_video', bench_avatar_video),
+    ('transcription', bench_transcription),
+    ('extract_audio', bench_extract_audio),
+    ('mux_copy', bench_mux_copy),
+    ('mux_reencode', bench_mux_reencode),
+    ('translate_google', bench_translate_google),
+    ('translate_deepl', bench_translate_deepl),
+    ('translate_local', bench_translate_local),
+    ('tts_aligned', bench_tts_aligned),
+    ('tts_single', bench_tts_single),
+    ('report', bench_report),
+    ('report_long', bench_report_long),
+    ('chatbot', bench_chatbot),
+    ('import_cold', bench_import_cold),
+    ('app_rerun', bench_app_rerun),
+]
+
+def time_call(func, repeat):
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - started)
+    return {
+        'median': round(statistics.median(runs), 5),
+        'min': round(min(runs), 5),
+        'mean': round(statistics.mean(runs), 5),
+        'runs': [round(r, 5) for r in runs],
+    }
+
+def run_benchmarks(fx, repeat=3, only=None):
+    results = {}
+    for name, setup in BENCHMARKS:
+        if only and name not in only:
+            continue
+        try:
+            results[name] = time_call(setup(fx), repeat)
+        except BenchmarkSkipped as e:
+            results[name] = {'skipped': str(e)}
+        except Exception as e:
+            results[name] = {'error': f"{type(e).__name__}: {e}"}
+        print(f"  {name:<20}{format_result(results[name])}", flush=True)
+    return results
+
+# --- HISTORIAL ---
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except Exception:
+        return None
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def append_history(path, entry):
+    history = load_history(path)
+    history.append(entry)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return history
+
+def find_run(history, ref):
+    """Resolve ref (a negative/positive index or a label) to a history entry."""
+    try:
+        return history[int(ref)]
+    except ValueError:
+        pass
+    for entry in reversed(history):
+        if entry.get('label') == ref:
+            return entry
+    raise KeyError(f"no hay ninguna corrida '{ref}' en el historial")
+
+def compare_runs(base, head, threshold=DEFAULT_THRESHOLD, min_delta=MIN_DELTA_SECONDS):
+    """Return one row per benchmark with the median change from base to head."""
+    rows = []
+    for name in head['results']:
+        old, new = base['results'].get(name, {}), head['results'][name]
+        if 'median' not in old or 'median' not in new:
+            rows.append({'name': name, 'status': 'sin datos'})
+            continue
+        delta = new['median'] - old['median']
+        change = delta / old['median'] if old['median'] else 0.0
+        status = '='
+        if abs(delta) >= min_delta and change > threshold:
+            status = 'REGRESION'
+        elif abs(delta) >= min_delta and change < -threshold:
+            status = 'mejora'
+        rows.append({'name': name, 'base': old['median'], 'head': new['median'], 'change': change,
+                     'status': status})
+    return rows
+
+def format_result(result):
+    if 'median' in result:
+        return f"{result['median']:.4f}s (min {result['min']:.4f}s)"
+    if 'skipped' in result:
+        return f"omitido: {result['skipped']}"
+    return f"error: {result['error']}"
+
+def print_comparison(base, head, rows):
+    print(f"base: {base.get('label') or base['timestamp']} ({base.get('commit')})  "
+          f"actual: {head.get('label') or head['timestamp']} ({head.get('commit')})")
+    if base.get('config') != head.get('config'):
+        print("Aviso: las corridas usan fixtures distintos, la comparación no es directa")
+    print(f"{'benchmark':<20}{'base':>10}{'actual':>10}{'cambio':>9}  estado")
+    for row in rows:
+        if 'base' not in row:
+            print(f"{row['name']:<20}{'-':>10}{'-':>10}{'-':>9}  {row['status']}")
+            continue
+        print(f"{row['name']:<20}{row['base']:>10.4f}{row['head']:>10.4f}{row['change']:>+9.1%}  {row['status']}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmark", description="Benchmarks del pipeline de Doblado 420")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="Correr los benchmarks y agregar el resultado al historial")
+    run.add_argument("--history", default=HISTORY_PATH)
+    run.add_argument("--label", default=None, help="Nombre de la corrida (p. ej. la rama o la optimización)")
+    run.add_argument("--segments", type=int, default=80, help="Segmentos de la transcripción sintética")
+    run.add_argument("--duration", type=float, default=60.0, help="Duración del video sintético (segundos)")
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--latency-ms", type=int, default=50, help="Latencia simulada de los servidores de prueba")
+    run.add_argument("--whisper-model", default="tiny")
+    run.add_argument("--only", default="", help="Benchmarks a correr, separados por coma")
+    run.add_argument("--keep-fixtures", action="store_true")
+    compare = sub.add_parser("compare", help="Comparar dos corridas del historial")
+    compare.add_argument("--history", default=HISTORY_PATH)
+    compare.add_argument("--base", default="-2", help="Índice o label de la corrida base (default: la anteúltima)")
+    compare.add_argument("--head", default="-1", help="Índice o label de la corrida a evaluar (default: la última)")
+    compare.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                         help="Aumento relativo de la mediana que cuenta como regresión")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        history_path = os.path.abspath(args.history)
+        work_dir = tempfile.mkdtemp(prefix="doblado-bench-")
+        # Caches y salidas van al directorio temporal: nada de la corrida queda cacheado
+        os.environ['DOBLADO_CACHE_DIR'] = os.path.join(work_dir, 'cache')
+        os.environ['DOBLADO_WORK_DIR'] = os.path.join(work_dir, 'work')
+        # La app que corre app_rerun no precarga modelos de Whisper
+        os.environ['WHISPER_PRELOAD'] = ''
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        previous_dir = os.getcwd()
+        os.chdir(work_dir)
+        stubs = StubServers(work_dir, args.latency_ms).start()
+        try:
+            print(f"Generando fixtures en {work_dir}...", flush=True)
+            fx = make_fixtures(work_dir, args.segments, args.duration)
+            fx.whisper_model = args.whisper_model
+            only = set(filter(None, args.only.split(',')))
+            results = run_benchmarks(fx, args.repeat, only)
+        finally:
+            stubs.stop()
+            os.chdir(previous_dir)
+            if not args.keep_fixtures:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        entry = {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'label': args.label,
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'machine': f"{platform.machine()} x{os.cpu_count()}",
+            'config': {'segments': args.segments, 'duration': args.duration, 'repeat': args.repeat,
+                       'latency_ms': args.latency_ms, 'whisper_model': args.whisper_model},
+            'results': results,
+        }
+        history = append_history(history_path, entry)
+        print(f"Resultados agregados a {history_path} ({len(history)} corridas)")
+        if len(history) > 1:
+            print_comparison(history[-2], entry, compare_runs(history[-2], entry))
+        return 0
+
+    if args.command == "compare":
+        history = load_history(args.history)
+        try:
+            base, head = find_run(history, args.base), find_run(history, args.head)
+        except (KeyError, IndexError) as e:
+            print(f"No se puede comparar: {e}")
+            return 2
+        rows = compare_runs(base, head, args.threshold)
+        print_comparison(base, head, rows)
+        regressions = [row['name'] for row in rows if row['status'] == 'REGRESION']
+        if regressions:
+            print(f"Regresiones: {', '.join(regressions)}")
+            return 1
+        return 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import os
+import re
+import json
+import math
+import threading
+import unicodedata
+
+# Índice de búsqueda para el chatbot: en lugar de mandar el informe completo de
+# todos los videos en cada pregunta, se indexan (BM25) los segmentos traducidos
+# con sus timestamps y las secciones de cada informe, y a la IA solo le llegan
+# los fragmentos más relevantes con la cita de video y minuto. Cada video guarda
+# su índice junto a sus artefactos; el chatbot combina los del lote.
+
+CHUNK_WORDS = int(os.getenv('CHAT_CHUNK_WORDS', '80'))
+TOP_K = int(os.getenv('CHAT_TOP_K', '6'))
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOPWORDS = set("""
+a al algo algunas algunos ante antes como con contra cual cuando de del desde donde durante e el ella ellas
+ellos en entre era es esa esas ese eso esos esta estaba estan este esto estos fue ha hay la las le les lo los
+mas me mi muy nada ni no nos o para pero por porque que se ser si sin sobre su sus tambien te tiene todo tu
+un una uno unos y ya yo the and of to in is it that for on with as this are be was you
+""".split())
+
+def normalize(text):
+    # Sin tildes ni mayúsculas: "periodo" encuentra "Período"
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+def tokenize(text):
+    terms = []
+    for word in re.findall(r"\w+", normalize(text)):
+        if word in STOPWORDS or len(word) < 2:
+            continue
+        # Plural simple: "plantas" y "planta" cuentan como el mismo término
+        if len(word) > 4 and word.endswith('s'):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+def format_time(seconds):
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{secs:02}" if hours else f"{minutes:02}:{secs:02}"
+
+def segment_chunks(video, segments, max_words=CHUNK_WORDS):
+    """Group consecutive translated segments into chunks of about max_words words."""
+    chunks, current, words = [], [], 0
+    for seg in segments:
+        text = seg['text'].strip()
+        if not text:
+            continue
+        current.append(seg)
+        words += len(text.split())
+        if words >= max_words:
+            chunks.append(current)
+            current, words = [], 0
+    if current:
+        chunks.append(current)
+    return [{'video': video, 'kind': 'segmento', 'start': group[0]['start'], 'end': group[-1]['end'],
+             'text': ' '.join(seg['text'].strip() for seg in group)} for group in chunks]
+
+def report_chunks(video, report_md):
+    """Split a Markdown report into its sections (one chunk per heading)."""
+    chunks, title, lines = [], None, []
+
+    def flush():
+        text = '\n'.join(lines).strip()
+        if text:
+            chunks.append({'video': video, 'kind': 'informe', 'title': title, 'text': text})
+
+    for line in report_md.split('\n'):
+        if line.startswith('#'):
+            flush()
+            title, lines = line.lstrip('#').strip(), []
+        else:
+            lines.append(line)
+    flush()
+    return chunks
+
+def citation(chunk):
+    if chunk['kind'] == 'segmento':
+        return f"{chunk['video']} @ {format_time(chunk['start'])}-{format_time(chunk['end'])}"
+    return f"{chunk['video']} · informe" + (f" · {chunk['title']}" if chunk.get('title') else "")
+
+class ChatIndex:
+    """BM25 index over transcript and report chunks of one or more videos."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        for chunk in chunks:
+            if 'terms' not in chunk:
+                terms = {}
+                for term in tokenize(chunk['text']):
+                    terms[term] = terms.get(term, 0) + 1
+                chunk['terms'] = terms
+        self.lengths = [sum(chunk['terms'].values()) for chunk in chunks]
+        self.avg_length = (sum(self.lengths) / len(chunks)) if chunks else 0.0
+        self.postings = {}
+        for i, chunk in enumerate(chunks):
+            for term, count in chunk['terms'].items():
+                self.postings.setdefault(term, []).append((i, count))
+
+    @classmethod
+    def for_video(cls, video, segments, report_md):
+        return cls(segment_chunks(video, segments) + report_chunks(video, report_md or ''))
+
+    @classmethod
+    def merge(cls, indexes):
+        chunks = []
+        for index in indexes:
+            chunks.extend(index.chunks)
+        return cls(chunks)
+
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'chunks': self.chunks}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f)['chunks'])
+
+    def search(self, query, k=TOP_K):
+        """Return up to k (score, chunk) pairs, best first."""
+        total = len(self.chunks)
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for i, count in postings:
+                norm = count + BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[i] / (self.avg_length or 1))
+                scores[i] = scores.get(i, 0.0) + idf * count * (BM25_K1 + 1) / norm
+        best = sorted(scores.items(), key=lambda item: -item[1])[:k]
+        return [(score, self.chunks[i]) for i, score in best]
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+def load_indexes(paths):
+    """Load and merge per-video indexes, reusing the result while the files do not change."""
+    stamp = tuple((path, os.path.getmtime(path)) for path in paths)
+    with _loaded_lock:
+        index = _loaded.get(stamp)
+    if index is None:
+        index = ChatIndex.merge([ChatIndex.load(path) for path in paths])
+        with _loaded_lock:
+            if len(_loaded) > 16:
+                _loaded.clear()
+            _loaded[stamp] = index
+    return index
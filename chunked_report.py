@@ -0,0 +1,110 @@
+import os
+import asyncio
+import tracing
+from openrouter import get_client, async_client
+
+# Informes por map-reduce: si el transcripto no entra cómodo en un solo prompt,
+# se parte en ventanas con un presupuesto de tokens, cada ventana se resume en
+# paralelo (map) y los resúmenes se combinan en una sola pasada final (reduce).
+# Como las ventanas corren en paralelo, la latencia casi no crece con la duración.
+
+# Aproximación de tokens: ~4 caracteres por token en español/inglés
+CHARS_PER_TOKEN = 4
+WINDOW_TOKENS = int(os.getenv('REPORT_WINDOW_TOKENS', '3000'))
+# Hasta este tamaño el transcripto va entero en un solo prompt, como antes
+DIRECT_MAX_TOKENS = int(os.getenv('REPORT_DIRECT_MAX_TOKENS', '6000'))
+# Si los resúmenes juntos superan esto, se vuelven a resumir antes del reduce
+REDUCE_MAX_TOKENS = int(os.getenv('REPORT_REDUCE_MAX_TOKENS', '8000'))
+MAP_TIMEOUT = 60
+REDUCE_TIMEOUT = 120
+
+MAP_PROMPT = """
+Resume la siguiente parte ({part} de {total}{span}) del transcripto de un video.
+Conserva los datos concretos: cifras, nombres, términos técnicos, pasos y recomendaciones.
+Responde solo con viñetas en Markdown, sin introducción.
+
+Transcripto:
+{text}
+"""
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def format_time(seconds):
+    minutes, secs = divmod(int(seconds), 60)
+    return f"{minutes:02}:{secs:02}"
+
+def window_texts(texts, max_tokens=WINDOW_TOKENS, segments=None):
+    """Group consecutive texts into windows of at most max_tokens.
+
+    Returns a list of (text, span) pairs; span is "mm:ss-mm:ss" when the
+    segments (dicts with start/end) are given, else None.
+    """
+    windows = []
+    current, size, first = [], 0, 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and size + tokens > max_tokens:
+            windows.append((first, i, current))
+            current, size, first = [], 0, i
+        current.append(text)
+        size += tokens
+    if current:
+        windows.append((first, len(texts), current))
+    result = []
+    for first, last, items in windows:
+        span = None
+        if segments:
+            span = f"{format_time(segments[first]['start'])}-{format_time(segments[last - 1]['end'])}"
+        result.append((' '.join(items), span))
+    return result
+
+def needs_chunking(texts, max_tokens=DIRECT_MAX_TOKENS):
+    return estimate_tokens(' '.join(texts)) > max_tokens
+
+async def _map_windows(windows, model):
+    async with async_client() as client:
+        total = len(windows)
+        prompts = [MAP_PROMPT.format(part=i, total=total, span=f", {span}" if span else "", text=text)
+                   for i, (text, span) in enumerate(windows, start=1)]
+        # El token bucket y el semáforo del cliente limitan cuántas van a la vez
+        return await asyncio.gather(*(client.acomplete(prompt, model=model, timeout=MAP_TIMEOUT)
+                                      for prompt in prompts))
+
+def map_windows(windows, model):
+    with tracing.span('openrouter.map', ventanas=len(windows)):
+        return asyncio.run(_map_windows(windows, model))
+
+def reduce_summaries(summaries, model):
+    """Summarize the summaries again until they fit in one reduce prompt."""
+    while estimate_tokens('\n\n'.join(summaries)) > REDUCE_MAX_TOKENS and len(summaries) > 1:
+        windows = window_texts(summaries, WINDOW_TOKENS)
+        if len(windows) == len(summaries):
+            # Cada resumen ya ocupa una ventana entera: no se puede agrupar más
+            break
+        summaries = map_windows(windows, model)
+    return summaries
+
+def build_report(texts, instructions, model, segments=None, on_update=None, client=None):
+    """Generate a Markdown report, chunking long transcripts with map-reduce.
+
+    ``instructions`` is the report prompt without the transcript. If on_update
+    is given the final pass is streamed and on_update(partial_markdown) is
+    called as the text arrives.
+    """
+    client = client or get_client()
+    full_text = ' '.join(texts)
+    if needs_chunking(texts):
+        windows = window_texts(texts, WINDOW_TOKENS, segments)
+        summaries = reduce_summaries(map_windows(windows, model), model)
+        body = '\n\n'.join(f"Parte {i}:\n{summary}" for i, summary in enumerate(summaries, start=1))
+        prompt = f"{instructions}\nEl transcripto es largo: estos son los resúmenes de sus partes, en orden.\n{body}\n"
+    else:
+        prompt = f"{instructions}\nTranscripto: {full_text}\n"
+    if on_update is None:
+        return client.complete(prompt, model=model, timeout=REDUCE_TIMEOUT)
+    report = ''
+    for delta in client.stream(prompt, model=model, timeout=REDUCE_TIMEOUT):
+        report += delta
+        on_update(report)
+    return report
@@ -0,0 +1,126 @@
+import os
+import math
+import multiprocessing
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import tracing
+from media import load_audio
+from whisper_pool import MODEL_MEMORY_MB, MEMORY_CAP_MB
+
+# Transcripción de grabaciones largas: el audio decodificado se parte en pedazos
+# cortados en silencios, con un poco de solapamiento, y cada pedazo se transcribe
+# en un proceso con su propio modelo (int8 en CPU) y su parte de los núcleos.
+# Los segmentos se vuelven a unir con timestamps globales: cada pedazo se queda
+# con los segmentos cuyo centro cae en su tramo, así el solapamiento no duplica.
+
+SAMPLE_RATE = 16000
+# Cada proceso de transcripción usa estos hilos (cpu_threads de ctranslate2)
+CHUNK_THREADS = int(os.getenv('WHISPER_CHUNK_THREADS', '2'))
+# 0: tantos procesos como entren en los núcleos asignados y en WHISPER_MEMORY_CAP_MB
+CHUNK_WORKERS = int(os.getenv('WHISPER_CHUNK_WORKERS', '0'))
+# Cuánto se puede correr un corte (segundos) buscando el silencio más profundo
+SEARCH_SECONDS = 20.0
+# Tramos de energía de 20 ms, suavizados en 0.5 s: gana un silencio largo, no una pausa entre sílabas
+FRAME_SAMPLES = SAMPLE_RATE // 50
+SMOOTH_FRAMES = 25
+
+def is_long(duration, options):
+    return options.get('chunk_min_seconds', 0) > 0 and duration >= options['chunk_min_seconds']
+
+def chunk_workers(size, cpu_threads, chunks):
+    """Number of transcription processes for chunks pieces within cpu_threads cores."""
+    workers = CHUNK_WORKERS or max(1, cpu_threads // CHUNK_THREADS)
+    # Cada proceso carga su propio modelo: no más de los que entran en el tope de memoria
+    workers = min(workers, max(1, MEMORY_CAP_MB // MODEL_MEMORY_MB.get(size, 1000)))
+    return max(1, min(workers, chunks))
+
+def quietest_point(audio, center, radius):
+    """Return the sample index of the quietest spot within radius of center."""
+    first = max(0, center - radius)
+    window = np.asarray(audio[first:min(len(audio), center + radius)], dtype=np.float32)
+    frames = len(window) // FRAME_SAMPLES
+    if frames < 2:
+        return center
+    energy = np.square(window[:frames * FRAME_SAMPLES]).reshape(frames, FRAME_SAMPLES).mean(axis=1)
+    width = min(frames, SMOOTH_FRAMES)
+    energy = np.convolve(energy, np.ones(width) / width, mode='same')
+    return first + int(np.argmin(energy)) * FRAME_SAMPLES + FRAME_SAMPLES // 2
+
+def plan_chunks(audio, chunk_seconds, overlap_seconds=0.0):
+    """Split audio at silences into about chunk_seconds pieces.
+
+    Returns (own_start, own_end, read_start, read_end) sample ranges: each
+    piece is transcribed over its read range (own range plus the overlap) and
+    keeps the segments centered in its own range.
+    """
+    total = len(audio)
+    count = max(1, math.ceil(total / (chunk_seconds * SAMPLE_RATE)))
+    step = total / count
+    radius = int(min(SEARCH_SECONDS * SAMPLE_RATE, step / 4))
+    cuts = [0] + [quietest_point(audio, int(i * step), radius) for i in range(1, count)] + [total]
+    overlap = int(overlap_seconds * SAMPLE_RATE)
+    return [(start, end, max(0, start - overlap), min(total, end + overlap))
+            for start, end in zip(cuts[:-1], cuts[1:]) if end > start]
+
+def stitch(chunks, results):
+    """Merge per-chunk (start, end, text) segments into one global timeline."""
+    segments = []
+    for (own_start, own_end, _, _), chunk_segments in zip(chunks, results):
+        for start, end, text in chunk_segments:
+            if own_start <= (start + end) / 2 * SAMPLE_RATE < own_end:
+                segments.append([start, end, text])
+    segments.sort(key=lambda seg: seg[0])
+    stitched = []
+    for start, end, text in segments:
+        previous = stitched[-1] if stitched else None
+        if previous and start < previous.end:
+            # Los dos pedazos transcribieron lo mismo (se pisan más de la mitad): queda el más
+            # largo, el otro suele estar cortado en el borde. Si apenas se pisan, se acomoda el inicio
+            if previous.end - start > min(end - start, previous.end - previous.start) / 2:
+                if end - start > previous.end - previous.start:
+                    stitched[-1] = SimpleNamespace(start=start, end=end, text=text)
+                continue
+            start = previous.end
+        stitched.append(SimpleNamespace(start=start, end=end, text=text))
+    return stitched
+
+def transcribe_chunk(model, audio, chunk, options):
+    from pipeline import transcribe
+    _, _, read_start, read_end = chunk
+    offset = read_start / SAMPLE_RATE
+    segments = transcribe(model, np.array(audio[read_start:read_end]), options)
+    return [(offset + seg.start, offset + seg.end, seg.text) for seg in segments]
+
+_worker_models = None
+
+def _init_worker(size, cpu_threads):
+    global _worker_models
+    from whisper_pool import ModelRegistry
+    _worker_models = ModelRegistry(cpu_threads=cpu_threads, num_workers=1)
+    _worker_models.get(size)
+
+def _transcribe_in_worker(audio_path, size, chunk, options):
+    with _worker_models.model(size) as model:
+        return transcribe_chunk(model, load_audio(audio_path), chunk, options)
+
+@tracing.traced('whisper.transcripcion_por_partes')
+def transcribe_long(models, size, audio_path, options):
+    """Transcribe a long recording in parallel chunks; same segments as pipeline.transcribe."""
+    audio = load_audio(audio_path)
+    chunks = plan_chunks(audio, options['chunk_seconds'], options['chunk_overlap_seconds'])
+    cpu_threads = getattr(models, 'cpu_threads', None) or os.cpu_count() or 1
+    workers = chunk_workers(size, cpu_threads, len(chunks))
+    tracing.set_attrs(partes=len(chunks), procesos=workers)
+    if workers == 1:
+        # Sin núcleos para repartir: los pedazos se transcriben en serie con el modelo del registro
+        with models.model(size) as model:
+            results = [transcribe_chunk(model, audio, chunk, options) for chunk in chunks]
+    else:
+        # spawn: el proceso padre puede tener hilos (Streamlit, el job runner) y no conviene forkearlo
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker,
+                                 initargs=(size, max(1, cpu_threads // workers))) as pool:
+            results = list(pool.map(_transcribe_in_worker, [audio_path] * len(chunks), [size] * len(chunks),
+                                    chunks, [options] * len(chunks)))
+    return stitch(chunks, results)
@@ -0,0 +1,32 @@
+import os
+
+# Opciones de transcripción configurables por variables de entorno (o por la CLI)
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ('0', 'false', 'no', '')
+
+WHISPER_BEAM_SIZE = int(os.getenv('WHISPER_BEAM_SIZE', '5'))
+# El filtro VAD (Silero) saltea los silencios antes de decodificar
+WHISPER_VAD_FILTER = _env_bool('WHISPER_VAD_FILTER', True)
+WHISPER_VAD_MIN_SILENCE_MS = int(os.getenv('WHISPER_VAD_MIN_SILENCE_MS', '500'))
+# Con un tamaño de lote > 0 se usa BatchedInferencePipeline de faster-whisper
+WHISPER_BATCH_SIZE = int(os.getenv('WHISPER_BATCH_SIZE', '0'))
+# Grabaciones de al menos esta duración (segundos) se parten en silencios y los
+# pedazos se transcriben en paralelo (ver chunked_transcription.py); 0 lo desactiva
+WHISPER_CHUNK_MIN_SECONDS = int(os.getenv('WHISPER_CHUNK_MIN_SECONDS', '1200'))
+WHISPER_CHUNK_SECONDS = int(os.getenv('WHISPER_CHUNK_SECONDS', '300'))
+WHISPER_CHUNK_OVERLAP_SECONDS = float(os.getenv('WHISPER_CHUNK_OVERLAP_SECONDS', '2'))
+
+def transcribe_options(beam_size=None, vad_filter=None, batch_size=None, chunk_min_seconds=None):
+    return {
+        'beam_size': WHISPER_BEAM_SIZE if beam_size is None else beam_size,
+        'vad_filter': WHISPER_VAD_FILTER if vad_filter is None else vad_filter,
+        'vad_min_silence_ms': WHISPER_VAD_MIN_SILENCE_MS,
+        'batch_size': WHISPER_BATCH_SIZE if batch_size is None else batch_size,
+        'chunk_min_seconds': WHISPER_CHUNK_MIN_SECONDS if chunk_min_seconds is None else chunk_min_seconds,
+        'chunk_seconds': WHISPER_CHUNK_SECONDS,
+        'chunk_overlap_seconds': WHISPER_CHUNK_OVERLAP_SECONDS,
+    }
@@ -1,10 +1,26 @@
 from PIL import Image, ImageDraw
 import os
+import uuid
+import threading
+import numpy as np
+from artifact_cache import file_digest, make_key
+from generate_lip_sync import MOUTHS
 
-def create_base_avatar():
+# Atlas de bocas: las diez formas se dibujan una sola vez por imagen de origen y
+# resolución de salida, y se guardan juntas en un .npy (10, alto, ancho, 3) que se
+# abre con memory-map. Los videos de avatar de cualquier tamaño leen de ahí sin
+# volver a pagar el dibujo ni el redimensionado con PIL.
+
+AVATAR_IMAGE = os.getenv('AVATAR_IMAGE', 'avatar/avatar.jpeg')
+ATLAS_DIR = os.path.join(os.getenv('DOBLADO_CACHE_DIR', '.cache'), 'avatar')
+# Cambia cuando cambia el dibujo de las bocas: invalida los atlas guardados
+ATLAS_VERSION = 2
+BACKGROUND = 'black'
+
+def create_base_avatar(image_path=AVATAR_IMAGE):
     # Intentar cargar la imagen del usuario
     try:
-        img = Image.open('avatar/avatar.jpeg').convert('RGB')
+        img = Image.open(image_path).convert('RGB')
         # Mantener resolución alta, redimensionar manteniendo aspecto
         img.thumbnail((800, 800), Image.Resampling.LANCZOS)
         print(f"Usando imagen personalizada del avatar, tamaño: {img.size}")
@@ -57,19 +73,79 @@ def create_mouth_shape(base_img, mouth_type):
         draw.ellipse((mouth_left, mouth_y, mouth_right, mouth_y + int(12 * scale_y)), fill='black')
     elif mouth_type == 'H':  # H
         draw.ellipse((mouth_left, mouth_y, mouth_right, mouth_y + int(8 * scale_y)), fill='black')
+    elif mouth_type == 'O':  # Oh / U: boca redondeada, más angosta y alta
+        draw.ellipse((int(92 * scale_x), mouth_y, int(108 * scale_x), mouth_y + int(18 * scale_y)), fill='black')
     elif mouth_type == 'X':  # Rest
         draw.line((mouth_left, mouth_y + int(5 * scale_y), mouth_right, mouth_y + int(5 * scale_y)), fill='black', width=max(1, int(3 * scale_x)))
 
     return img
 
+def parse_size(text):
+    """Parse an output resolution like '1280x720' into (width, height); None keeps the avatar size."""
+    if not text:
+        return None
+    width, height = (int(value) for value in text.lower().split('x'))
+    return width, height
+
+def _even(value):
+    return max(2, value // 2 * 2)
+
+def render_atlas(size=None, image_path=AVATAR_IMAGE):
+    """Draw every mouth shape and return a uint8 array (len(MOUTHS), height, width, 3).
+
+    With size=(width, height) the avatar is scaled to fit and centered on a
+    canvas of that size; otherwise the avatar keeps its own size. Width and
+    height are rounded down to even numbers (yuv420p needs them).
+    """
+    base = create_base_avatar(image_path)
+    if size is None:
+        canvas_size = (_even(base.width), _even(base.height))
+    else:
+        canvas_size = (_even(size[0]), _even(size[1]))
+    scale = min(canvas_size[0] / base.width, canvas_size[1] / base.height)
+    face_size = (max(1, round(base.width * scale)), max(1, round(base.height * scale)))
+    # Se redimensiona una vez y las bocas se dibujan ya en el tamaño final
+    face = base.resize(face_size, Image.Resampling.LANCZOS) if face_size != base.size else base
+    offset = ((canvas_size[0] - face_size[0]) // 2, (canvas_size[1] - face_size[1]) // 2)
+    atlas = np.empty((len(MOUTHS), canvas_size[1], canvas_size[0], 3), dtype=np.uint8)
+    for index, mouth in enumerate(MOUTHS):
+        canvas = Image.new('RGB', canvas_size, color=BACKGROUND)
+        canvas.paste(create_mouth_shape(face, mouth), offset)
+        atlas[index] = np.asarray(canvas)
+    return atlas
+
+def atlas_key(size=None, image_path=AVATAR_IMAGE):
+    source = file_digest(image_path) if os.path.exists(image_path) else 'simple'
+    return make_key('atlas', ATLAS_VERSION, source, list(size) if size else None, MOUTHS)
+
+_atlases = {}
+_atlases_lock = threading.Lock()
+
+def get_atlas(size=None, image_path=AVATAR_IMAGE, cache_dir=ATLAS_DIR):
+    """Return the memory-mapped mouth atlas for this image and size, building it once."""
+    key = atlas_key(size, image_path)
+    with _atlases_lock:
+        atlas = _atlases.get(key)
+        if atlas is not None:
+            return atlas
+        path = os.path.join(cache_dir, f"{key}.npy")
+        if not os.path.exists(path):
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, render_atlas(size, image_path))
+            os.replace(tmp_path, path)
+        atlas = np.load(path, mmap_mode='r')
+        _atlases[key] = atlas
+        return atlas
+
 if __name__ == "__main__":
-    base = create_base_avatar()
+    # Vista previa: exporta las bocas del atlas como PNG
+    import sys
+    atlas = get_atlas(parse_size(sys.argv[1]) if len(sys.argv) > 1 else None)
     os.makedirs('avatar_frames', exist_ok=True)
+    for mouth, image in zip(MOUTHS, atlas):
+        Image.fromarray(np.asarray(image)).save(f'avatar_frames/avatar_{mouth}.png')
+        print(f'Creado avatar_{mouth}.png')
 
-    phonemes = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'X']
-    for phoneme in phonemes:
-        mouth_img = create_mouth_shape(base, phoneme)
-        mouth_img.save(f'avatar_frames/avatar_{phoneme}.png')
-        print(f'Creado avatar_{phoneme}.png')
-
-    print("Avatares creados en avatar_frames/")
\ No newline at end of file
+    print("Avatares creados en avatar_frames/")
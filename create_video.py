@@ -1,38 +1,59 @@
-import json
-from moviepy import ImageSequenceClip, AudioFileClip
+import math
 import os
+import numpy as np
+from create_avatar import get_atlas
+from media import encode_frame_runs, probe_duration
+from generate_lip_sync import MOUTHS, REST_MOUTH, load_lip_sync
+from tracing import traced
 
-def create_avatar_video(lip_sync_file, audio_file, output_video='avatar_video.mp4', fps=24):
-    with open(lip_sync_file, 'r') as f:
-        lip_sync_data = json.load(f)
+def frame_runs(starts, durations, codes, fps, min_frames=0):
+    """Turn the lip-sync timeline into merged (mouth_index, frame_count) runs.
 
-    frames = []
-    prev_time = 0
-    for item in lip_sync_data:
-        time = item['time']
-        mouth = item['mouth']
-        duration = time - prev_time
-        if duration > 0:
-            frame_path = f'avatar_frames/avatar_{mouth}.png'
-            if os.path.exists(frame_path):
-                num_frames = max(1, int(duration * fps))
-                frames.extend([frame_path] * num_frames)
-        prev_time = time
+    Boundaries are rounded to whole frames on the absolute time, so long
+    videos do not drift. Gaps between runs show the rest mouth, and the
+    video lasts at least min_frames.
+    """
+    rest = MOUTHS.index(REST_MOUTH)
+    begin = np.rint(np.asarray(starts, dtype=np.float64) * fps).astype(np.int64)
+    end = np.rint((np.asarray(starts, dtype=np.float64) + durations) * fps).astype(np.int64)
+    # Si dos tramos se pisan, cada uno empieza donde terminó el anterior
+    previous_end = np.maximum.accumulate(np.concatenate([[0], end]))[:-1]
+    begin = np.maximum(begin, previous_end)
+    end = np.maximum(end, begin)
+    runs = []
 
-    # Crear clip de secuencia de imágenes
-    if frames:
-        clip = ImageSequenceClip(frames, fps=fps)
-        # Agregar audio
-        if os.path.exists(audio_file):
-            audio = AudioFileClip(audio_file)
-            if audio.duration > clip.duration:
-                audio = audio.subclipped(0, clip.duration)
-            clip = clip.with_audio(audio)
-        # Renderizar
-        clip.write_videofile(output_video, codec="libx264", audio_codec="aac", logger=None)
-        print(f"Video creado: {output_video}, duración: {clip.duration}s")
-    else:
+    def add(index, count):
+        if count <= 0:
+            return
+        if runs and runs[-1][0] == index:
+            runs[-1][1] += count
+        else:
+            runs.append([index, count])
+
+    for code, first, last, gap_start in zip(codes.tolist(), begin.tolist(), end.tolist(), previous_end.tolist()):
+        add(rest, first - gap_start)
+        add(code if code < len(MOUTHS) else rest, last - first)
+    add(rest, min_frames - (int(end.max()) if len(end) else 0))
+    return [tuple(run) for run in runs]
+
+@traced('avatar.video')
+def create_avatar_video(lip_sync_file, audio_file, output_video='avatar_video.mp4', fps=24, size=None):
+    """Render the avatar video; size=(width, height) picks the output resolution."""
+    starts, durations, codes = load_lip_sync(lip_sync_file)
+
+    # Las bocas salen del atlas cacheado (memory-map) y los frames van directo a ffmpeg
+    images = get_atlas(size)
+    if not len(codes):
         print("No frames to create video")
+        return
+    audio_path = audio_file if os.path.exists(audio_file) else None
+    audio_duration = probe_duration(audio_path) if audio_path else None
+    # El video cubre todo el audio: al final queda la boca en reposo
+    min_frames = math.ceil(audio_duration * fps) if audio_duration else 0
+    runs = frame_runs(starts, durations, codes, fps, min_frames)
+    encode_frame_runs(images, runs, fps, output_video, audio_path)
+    duration = sum(count for _, count in runs) / fps
+    print(f"Video creado: {output_video}, duración: {duration}s")
 
 if __name__ == "__main__":
-    create_avatar_video('lip_sync_test.json', 'temp_audio_es.mp3', 'avatar_test.mp4')
\ No newline at end of file
+    create_avatar_video('lip_sync_test.npz', 'temp_audio_es.mp3', 'avatar_test.mp4')
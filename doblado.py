@@ -0,0 +1,269 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Modo batch sin interfaz: python -m doblado batch <dir>
+# Cada worker carga su propio modelo Whisper una sola vez y procesa videos
+# completos; el resultado de cada video se guarda en un manifiesto JSON.
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.mov')
+
+_worker_models = None
+
+def _init_worker(model_size, cpu_threads):
+    global _worker_models
+    from whisper_pool import ModelRegistry
+    _worker_models = ModelRegistry(cpu_threads=cpu_threads)
+    if model_size != 'auto':
+        _worker_models.get(model_size)
+
+def _process_one(video_path, original_name, output_dir, tag, job_options):
+    from pipeline import process_video
+    started = time.time()
+    entry = {'name': original_name, 'input': video_path}
+    try:
+        result = process_video(_worker_models, video_path, original_name, output_dir=output_dir,
+                               tag=tag, **job_options)
+        entry.update(save_outputs(result, output_dir))
+    except Exception as e:
+        entry.update({'status': 'error', 'error': str(e)})
+    entry['seconds'] = round(time.time() - started, 2)
+    return entry
+
+def save_outputs(result, output_dir):
+    report_path = os.path.join(output_dir, result['report_name'])
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write(result['report_md'])
+    json_path = os.path.join(output_dir, result['json_name'])
+    with open(json_path, 'w', encoding='utf-8') as f:
+        f.write(result['json_data'])
+    trace_path = os.path.join(output_dir, result['trace_name'])
+    with open(trace_path, 'w', encoding='utf-8') as f:
+        json.dump(result['trace'], f, ensure_ascii=False, indent=2)
+    return {
+        'status': 'ok',
+        'video_path': result['video_path'],
+        'srt_path': result['srt_path'],
+        'report_path': report_path,
+        'json_path': json_path,
+        'avatar_path': result['avatar_path'],
+        'trace_path': trace_path,
+        'dubs': [{'target': dub['target'], 'video_path': dub['video_path'], 'srt_path': dub['srt_path']}
+                 for dub in result.get('dubs', [])],
+    }
+
+def find_videos(input_dir):
+    """Return (path, name) for each video; name gives the stem of its output files.
+
+    Videos that share a stem (clase.mp4 and clase.mkv) would write the same
+    outputs, so their names get the extension added: "clase (mkv).mkv".
+    """
+    names = [name for name in sorted(os.listdir(input_dir)) if name.lower().endswith(VIDEO_EXTENSIONS)]
+    stems = {}
+    for name in names:
+        stem = os.path.splitext(name)[0].casefold()
+        stems[stem] = stems.get(stem, 0) + 1
+    videos, taken = [], set()
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        if stems[stem.casefold()] > 1:
+            stem = f"{stem} ({ext[1:]})"
+        # Por si "clase (mkv)" también existe como archivo
+        base, number = stem, 2
+        while base.casefold() in taken:
+            base = f"{stem} {number}"
+            number += 1
+        taken.add(base.casefold())
+        videos.append((os.path.join(input_dir, name), base + ext))
+    return videos
+
+def write_manifest(path, entries, stage_stats=None):
+    manifest = {
+        'updated': datetime.now().isoformat(),
+        'total': len(entries),
+        'ok': sum(1 for e in entries if e.get('status') == 'ok'),
+        'videos': entries,
+    }
+    if stage_stats is not None:
+        manifest['stages'] = stage_stats.summary()
+        manifest['bottleneck'] = stage_stats.bottleneck()
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def observe_trace(entry):
+    # En modo pool los spans se registran en los workers: los sumamos a las métricas del proceso principal
+    from tracing import METRICS
+    if not entry.get('trace_path'):
+        return
+    with open(entry['trace_path'], 'r', encoding='utf-8') as f:
+        for span in json.load(f)['spans']:
+            METRICS.observe_dict(span)
+
+def run_batch(input_dir, output_dir, workers, job_options, manifest_path=None):
+    videos = find_videos(input_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = manifest_path or os.path.join(output_dir, 'manifest.json')
+    # Repartimos los núcleos entre workers para no sobre-suscribir la CPU
+    cpu_threads = max(1, (os.cpu_count() or 1) // workers)
+    entries = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(job_options['whisper_model'], cpu_threads)) as pool:
+        futures = {
+            pool.submit(_process_one, path, name, output_dir, i, job_options): path
+            for i, (path, name) in enumerate(videos)
+        }
+        for future in as_completed(futures):
+            entry = future.result()
+            observe_trace(entry)
+            entries.append(entry)
+            write_manifest(manifest_path, entries)
+            print(f"[{len(entries)}/{len(videos)}] {entry['name']}: {entry['status']} ({entry['seconds']}s)")
+    write_manifest(manifest_path, entries)
+    return entries
+
+def run_batch_pipelined(input_dir, output_dir, job_options, manifest_path=None,
+                        queue_size=2, workers=None):
+    from pipeline import new_job, job_result
+    from whisper_pool import ModelRegistry
+    from staged_pipeline import StageStats, run_pipelined, format_stats
+    videos = find_videos(input_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = manifest_path or os.path.join(output_dir, 'manifest.json')
+    models = ModelRegistry()
+    if job_options['whisper_model'] != 'auto':
+        models.preload_async([job_options['whisper_model']])
+    stats = StageStats()
+    jobs = (new_job(path, name, output_dir, tag=i, **job_options)
+            for i, (path, name) in enumerate(videos))
+    entries = []
+    for job in run_pipelined(jobs, models, stats=stats, queue_size=queue_size, workers=workers):
+        entry = {'name': job['name'], 'input': job['video_path'], 'timings': job['timings'],
+                 'cached': job['cached']}
+        if 'error' in job:
+            entry.update({'status': 'error', 'error': job['error']})
+        else:
+            try:
+                entry.update(save_outputs(job_result(job), output_dir))
+            except Exception as e:
+                entry.update({'status': 'error', 'error': str(e)})
+        entry['seconds'] = round(sum(job['timings'].values()), 2)
+        entries.append(entry)
+        write_manifest(manifest_path, entries, stats)
+        print(f"[{len(entries)}/{len(videos)}] {entry['name']}: {entry['status']} ({entry['seconds']}s)")
+    write_manifest(manifest_path, entries, stats)
+    print(format_stats(stats))
+    return entries
+
+def parse_targets(value):
+    # "es:es-AR-TomasNeural,pt:pt-BR-AntonioNeural" -> [('es', 'es-AR-TomasNeural'), ('pt', 'pt-BR-AntonioNeural')]
+    if not value:
+        return None
+    targets = []
+    for item in filter(None, value.split(',')):
+        language, _, voice = item.strip().partition(':')
+        if not language or not voice:
+            raise argparse.ArgumentTypeError(f"destino inválido '{item}': se espera idioma:voz")
+        targets.append((language, voice))
+    from pipeline import validate_targets
+    try:
+        return validate_targets(targets)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def parse_stage_workers(value):
+    workers = {}
+    for item in filter(None, value.split(',')):
+        stage, _, count = item.partition('=')
+        workers[stage.strip()] = int(count)
+    return workers
+
+def main(argv=None):
+    load_dotenv()
+    parser = argparse.ArgumentParser(prog="doblado", description="Doblado 420 sin interfaz")
+    sub = parser.add_subparsers(dest="command", required=True)
+    batch = sub.add_parser("batch", help="Doblar todos los videos de un directorio")
+    batch.add_argument("input_dir")
+    batch.add_argument("-o", "--output-dir", default="doblados")
+    batch.add_argument("-j", "--workers", type=int, default=max(1, (os.cpu_count() or 1) // 4))
+    batch.add_argument("--model", default="auto",
+                       help="Tamaño del modelo Whisper, o 'auto' para elegirlo por duración y --tier")
+    batch.add_argument("--tier", default="equilibrado", choices=["rapido", "equilibrado", "preciso"],
+                       help="Nivel de precisión usado con --model auto")
+    batch.add_argument("--deepl-key", default=os.getenv('DEEPL_API_KEY'))
+    batch.add_argument("--translator", default=None, choices=["auto", "google", "deepl", "local"],
+                       help="Proveedor de traducción; 'local' usa un modelo CTranslate2 sin red (default: DOBLADO_TRANSLATOR o auto)")
+    batch.add_argument("--targets", type=parse_targets, default=None,
+                       help="Destinos idioma:voz separados por coma, p. ej. es:es-AR-TomasNeural,pt:pt-BR-AntonioNeural;"
+                            " el primero es el principal (default: es:es-AR-TomasNeural)")
+    batch.add_argument("--multi-audio", action="store_true",
+                       help="Con varios destinos, un solo MP4 con una pista de audio por destino")
+    batch.add_argument("--avatar", action="store_true", help="Generar video de avatar")
+    batch.add_argument("--avatar-size", default=None,
+                       help="Resolución del video de avatar, p. ej. 1280x720 o 1080x1080 (default: tamaño de la imagen)")
+    batch.add_argument("--manifest", default=None)
+    batch.add_argument("--single-tts", action="store_true",
+                       help="Sintetizar todo el texto en una sola llamada en lugar de un clip alineado por segmento")
+    batch.add_argument("--no-cache", action="store_true",
+                       help="Recalcular todas las etapas sin usar el cache de artefactos")
+    batch.add_argument("--beam-size", type=int, default=None, help="Beam size de Whisper (default 5)")
+    batch.add_argument("--no-vad", action="store_true", help="No filtrar silencios con VAD antes de transcribir")
+    batch.add_argument("--batch-size", type=int, default=None,
+                       help="Transcribir por lotes con BatchedInferencePipeline (0 = desactivado)")
+    batch.add_argument("--chunk-min-seconds", type=int, default=None,
+                       help="Desde esta duración el audio se parte en silencios y se transcribe en paralelo (0 = nunca)")
+    batch.add_argument("--pipelined", action="store_true",
+                       help="Solapar etapas entre videos en un solo proceso en lugar de un pool de workers")
+    batch.add_argument("--queue-size", type=int, default=2, help="Tamaño de las colas entre etapas (--pipelined)")
+    batch.add_argument("--stage-workers", default="traduccion=2,informe=2",
+                       help="Hilos por etapa en modo --pipelined, p. ej. traduccion=4,informe=2")
+    batch.add_argument("--metrics-port", type=int, default=None,
+                       help="Exponer métricas de Prometheus en http://0.0.0.0:<puerto>/metrics")
+    batch.add_argument("--profile", default=None,
+                       help="Etapas a perfilar con cProfile (o py-spy con DOBLADO_PROFILER=py-spy), p. ej. voz,mezcla")
+    args = parser.parse_args(argv)
+
+    if args.command == "batch":
+        if args.profile:
+            # Antes de importar el pipeline: los workers heredan la variable de entorno
+            os.environ['DOBLADO_PROFILE_STAGES'] = args.profile
+        from config import transcribe_options
+        from tracing import start_metrics_server
+        from create_avatar import parse_size
+        start_metrics_server(args.metrics_port)
+        job_options = {
+            'deepl_api_key': args.deepl_key,
+            'translator': args.translator,
+            'targets': args.targets,
+            'multi_audio': args.multi_audio,
+            'generate_avatar': args.avatar,
+            'avatar_size': parse_size(args.avatar_size),
+            'aligned_tts': not args.single_tts,
+            'whisper_model': args.model,
+            'accuracy_tier': args.tier,
+            'use_cache': not args.no_cache,
+            'transcribe_options': transcribe_options(beam_size=args.beam_size,
+                                                     vad_filter=False if args.no_vad else None,
+                                                     batch_size=args.batch_size,
+                                                     chunk_min_seconds=args.chunk_min_seconds),
+        }
+        if args.pipelined:
+            entries = run_batch_pipelined(args.input_dir, args.output_dir, job_options,
+                                          manifest_path=args.manifest,
+                                          queue_size=args.queue_size,
+                                          workers=parse_stage_workers(args.stage_workers))
+        else:
+            entries = run_batch(args.input_dir, args.output_dir, args.workers, job_options,
+                                manifest_path=args.manifest)
+        failed = [e for e in entries if e['status'] != 'ok']
+        return 1 if failed else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
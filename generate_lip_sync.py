@@ -1,8 +1,9 @@
-from phonemizer import phonemize
-import re
+import os
 import json
+import numpy as np
+from tracing import traced
 
-# Mapeo simple de fonemas IPA a formas de boca (A-H, X)
+# Mapeo simple de fonemas IPA a formas de boca (A-H, O, X)
 phoneme_to_mouth = {
     'a': 'A', 'ɑ': 'A', 'æ': 'A', 'ʌ': 'A', 'ə': 'A', 'ɐ': 'A',
     'e': 'E', 'ɛ': 'E', 'ɪ': 'E', 'i': 'E',
@@ -18,9 +19,25 @@ phoneme_to_mouth = {
     ' ': 'X',  # pausa
 }
 
-def text_to_phonemes(text, language='es'):
-    # Fonemizar el texto
-    phonemes = phonemize(text, language=language, backend='espeak', strip=True, preserve_punctuation=False)
+# Formas de boca con frame propio; en el timeline se guardan como índice de esta lista
+MOUTHS = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'O', 'X']
+REST_MOUTH = 'X'
+# Cambia cuando cambia cómo se calcula el timeline: invalida los avatares cacheados
+LIP_SYNC_VERSION = 3
+# Procesos de espeak en paralelo para fonemizar el lote
+PHONEMIZE_JOBS = int(os.getenv('LIPSYNC_PHONEMIZE_JOBS', str(os.cpu_count() or 1)))
+
+def text_to_phonemes(text, language='es', njobs=1):
+    # Fonemizar el texto (o una lista de textos en una sola llamada, un resultado por texto)
+    from phonemizer import phonemize
+    if not isinstance(text, str):
+        # phonemizer trabaja por líneas: un salto de línea dentro de un texto lo partiría en dos
+        text = [' '.join(item.split('\n')) for item in text]
+    # preserve_empty_lines: sin esto phonemizer descarta las líneas vacías y corre los resultados siguientes
+    phonemes = phonemize(text, language=language, backend='espeak', strip=True, preserve_punctuation=False,
+                         preserve_empty_lines=True, njobs=njobs)
+    if not isinstance(text, str) and len(phonemes) != len(text):
+        raise RuntimeError(f"phonemizer devolvió {len(phonemes)} resultados para {len(text)} textos")
     return phonemes
 
 def phonemes_to_mouth_shapes(phonemes):
@@ -32,28 +49,70 @@ def phonemes_to_mouth_shapes(phonemes):
             shapes.append('X')  # default
     return shapes
 
-def generate_lip_sync_data(segments, output_file='lip_sync.json'):
-    lip_sync_data = []
-    for seg in segments:
-        start = seg['start']
-        end = seg['end']
-        text = seg['text']
-        phonemes = text_to_phonemes(text)
+def mouth_codes(shapes):
+    rest = MOUTHS.index(REST_MOUTH)
+    return [MOUTHS.index(shape) if shape in MOUTHS else rest for shape in shapes]
+
+def merge_runs(starts, durations, codes):
+    """Merge adjacent entries with the same mouth that touch in time."""
+    starts = np.asarray(starts, dtype=np.float64)
+    durations = np.asarray(durations, dtype=np.float64)
+    codes = np.asarray(codes, dtype=np.uint8)
+    if len(codes) == 0:
+        return starts.astype(np.float32), durations.astype(np.float32), codes
+    ends = starts + durations
+    # Empieza un run nuevo si cambia la boca o si hay un hueco (silencio) con el anterior
+    new_run = np.ones(len(codes), dtype=bool)
+    new_run[1:] = (codes[1:] != codes[:-1]) | (starts[1:] - ends[:-1] > 1e-6)
+    first = np.flatnonzero(new_run)
+    last = np.append(first[1:], len(codes)) - 1
+    return (starts[first].astype(np.float32), (ends[last] - starts[first]).astype(np.float32), codes[first])
+
+def save_lip_sync(path, starts, durations, codes):
+    # .npz con tres arrays: inicio, duración y código de boca de cada tramo
+    with open(path, 'wb') as f:
+        np.savez_compressed(f, start=starts, duration=durations, mouth=codes)
+    return path
+
+def load_lip_sync(path):
+    """Return (start, duration, mouth code) arrays from a lip-sync file.
+
+    Also reads the old JSON list of {'time', 'mouth'} where each shape lasts
+    until the next one.
+    """
+    if path.endswith('.json'):
+        with open(path, 'r') as f:
+            items = sorted(json.load(f), key=lambda item: item['time'])
+        times = np.array([item['time'] for item in items], dtype=np.float64)
+        durations = np.append(np.diff(times), 1 / 24) if len(times) else times
+        return merge_runs(times, durations, mouth_codes([item['mouth'] for item in items]))
+    with np.load(path) as data:
+        return data['start'], data['duration'], data['mouth']
+
+@traced('avatar.lip_sync')
+def generate_lip_sync_data(segments, output_file='lip_sync.npz'):
+    """Spread the phonemes of each interval evenly over its start/end.
+
+    segments can be the translated segments or, better, the words of the
+    dubbed track with their real timing (see tts.place_words).
+    """
+    segments = [seg for seg in segments if seg['text'].strip()]
+    # Una sola llamada para todos los segmentos: espeak arranca una vez por proceso, no por segmento
+    all_phonemes = text_to_phonemes([seg['text'] for seg in segments], njobs=PHONEMIZE_JOBS) if segments else []
+    starts, durations, codes = [], [], []
+    for seg, phonemes in zip(segments, all_phonemes):
         shapes = phonemes_to_mouth_shapes(phonemes)
-        duration = end - start
-        num_phonemes = len(shapes)
-        if num_phonemes > 0:
-            time_per_phoneme = duration / num_phonemes
-            current_time = start
-            for shape in shapes:
-                lip_sync_data.append({
-                    'time': current_time,
-                    'mouth': shape
-                })
-                current_time += time_per_phoneme
-    with open(output_file, 'w') as f:
-        json.dump(lip_sync_data, f, indent=2)
-    return lip_sync_data
+        if shapes:
+            time_per_phoneme = (seg['end'] - seg['start']) / len(shapes)
+            starts.append(seg['start'] + np.arange(len(shapes)) * time_per_phoneme)
+            durations.append(np.full(len(shapes), time_per_phoneme))
+            codes.append(mouth_codes(shapes))
+    if codes:
+        timeline = merge_runs(np.concatenate(starts), np.concatenate(durations), np.concatenate(codes))
+    else:
+        timeline = merge_runs([], [], [])
+    save_lip_sync(output_file, *timeline)
+    return timeline
 
 if __name__ == "__main__":
     # Ejemplo con segmentos de prueba
@@ -61,5 +120,5 @@ if __name__ == "__main__":
         {'start': 0, 'end': 2, 'text': 'Hola mundo'},
         {'start': 2, 'end': 4, 'text': 'Esto es una prueba'}
     ]
-    data = generate_lip_sync_data(test_segments, 'lip_sync_test.json')
-    print("Datos de lip-sync generados:", data[:10])  # primeros 10
\ No newline at end of file
+    starts, durations, codes = generate_lip_sync_data(test_segments, 'lip_sync_test.npz')
+    print("Datos de lip-sync generados:", [(float(s), float(d), MOUTHS[c]) for s, d, c in zip(starts, durations, codes)][:10])
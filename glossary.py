@@ -0,0 +1,137 @@
+import os
+import re
+import glob
+import time
+import threading
+from artifact_cache import make_key
+
+# Glosario de reemplazos para la traducción (cannabis, química, cultivo y estilo
+# argentino). Los términos se cargan de archivos .tsv y se compilan en una sola
+# regex con forma de trie: cada segmento se recorre una vez, sin importar cuántos
+# términos haya, y un reemplazo nunca vuelve a ser reemplazado por otro término.
+#
+# Formato: una entrada por línea, "origen<TAB>reemplazo[<TAB>opciones]"; las
+# líneas vacías y las que empiezan con # se ignoran. Por defecto la búsqueda no
+# distingue mayúsculas y respeta las del texto original ("Capullo" -> "Cogollo");
+# con la opción "exacto" solo coincide tal cual está escrito. Siempre se buscan
+# palabras completas.
+
+GLOSSARY_PATH = os.getenv('DOBLADO_GLOSSARY',
+                          os.path.join(os.path.dirname(os.path.abspath(__file__)), 'glosario'))
+# Cada cuánto (segundos) se revisa si los archivos cambiaron
+CHECK_INTERVAL = 1.0
+
+def glossary_files(path=GLOSSARY_PATH):
+    files = []
+    for entry in path.split(os.pathsep):
+        if os.path.isdir(entry):
+            files.extend(sorted(glob.glob(os.path.join(entry, '*.tsv'))))
+        elif os.path.exists(entry):
+            files.append(entry)
+    return files
+
+def read_entries(paths):
+    """Return [(source, replacement, exact)] from glossary files; later entries win."""
+    entries = {}
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for number, line in enumerate(f, start=1):
+                line = line.rstrip('\n')
+                if not line.strip() or line.lstrip().startswith('#'):
+                    continue
+                fields = line.split('\t')
+                if len(fields) < 2 or not fields[0].strip():
+                    print(f"Glosario {path}:{number}: se esperaba 'origen<TAB>reemplazo', se ignora la línea")
+                    continue
+                source, replacement = fields[0].strip(), fields[1].strip()
+                exact = len(fields) > 2 and 'exacto' in fields[2].lower()
+                entries[source if exact else source.casefold()] = (source, replacement, exact)
+    return list(entries.values())
+
+def trie_pattern(terms):
+    """Build a regex matching any of terms, factored as a trie.
+
+    The matching cost depends on the term length, not on how many terms there are.
+    """
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        end = '' in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        if len(branches) == 1 and not end:
+            return branches[0]
+        body = '(?:' + '|'.join(branches) + ')'
+        # Un término que es prefijo de otro: la rama larga es opcional y greedy (gana la más larga)
+        return body + '?' if end else body
+
+    return build(trie)
+
+def match_case(matched, replacement):
+    if len(matched) > 1 and matched.isupper():
+        return replacement.upper()
+    if matched[:1].isupper() and replacement[:1].islower():
+        return replacement[:1].upper() + replacement[1:]
+    if matched[:1].islower() and replacement[:1].isupper() and not replacement[1:2].isupper():
+        return replacement[:1].lower() + replacement[1:]
+    return replacement
+
+class Glossary:
+    """Compiled glossary that applies every replacement in a single pass."""
+
+    def __init__(self, entries):
+        self.exact = {source: replacement for source, replacement, exact in entries if exact}
+        self.folded = {source.casefold(): replacement for source, replacement, exact in entries if not exact}
+        # Identifica el contenido del glosario: cambia la clave de cache de la traducción
+        self.version = make_key(sorted(entries))[:16]
+        groups = []
+        if self.exact:
+            groups.append(trie_pattern(self.exact))
+        if self.folded:
+            groups.append('(?i:' + trie_pattern(self.folded) + ')')
+        self.regex = re.compile(r'(?<!\w)(?:' + '|'.join(groups) + r')(?!\w)') if groups else None
+
+    @classmethod
+    def from_files(cls, paths):
+        return cls(read_entries(paths))
+
+    def _replace(self, match):
+        matched = match.group(0)
+        if matched in self.exact:
+            return self.exact[matched]
+        replacement = self.folded.get(matched.casefold())
+        if replacement is None:
+            # La regex compara letra por letra y casefold puede cambiar el largo ('İ' -> 'i̇'):
+            # se repite la comparación de la regex y, si igual no aparece, el texto queda como estaba
+            replacement = self.folded.get(''.join(char.lower()[:1] for char in matched), matched)
+        return match_case(matched, replacement)
+
+    def apply(self, text):
+        if self.regex is None:
+            return text
+        return self.regex.sub(self._replace, text)
+
+_cached = {}
+_cached_lock = threading.Lock()
+
+def get_glossary(path=GLOSSARY_PATH):
+    """Return the compiled glossary, recompiling only when its files change."""
+    with _cached_lock:
+        cached = _cached.get(path)
+        now = time.monotonic()
+        if cached and now - cached[2] < CHECK_INTERVAL:
+            return cached[1]
+        files = glossary_files(path)
+        stamp = tuple((name, os.path.getmtime(name), os.path.getsize(name)) for name in files)
+        if cached and cached[0] == stamp:
+            _cached[path] = (stamp, cached[1], now)
+            return cached[1]
+        glossary = Glossary.from_files(files)
+        _cached[path] = (stamp, glossary, now)
+        return glossary
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+# Trabajos con checkpoints: cada video guarda en SQLite las etapas completadas y
+# el estado intermedio (segmentos, traducciones, rutas de artefactos), así un
+# trabajo interrumpido (refresh del navegador, rerun de Streamlit o caída del
+# proceso) continúa desde la última etapa terminada en lugar de empezar de cero.
+
+WORK_DIR = os.getenv('DOBLADO_WORK_DIR', 'work')
+
+# Campos del trabajo que no se guardan tal cual en el estado (la API key de DeepL
+# nunca se escribe a disco: se vuelve a pasar al retomar el lote)
+_TRANSIENT_FIELDS = ('segments', 'deepl_api_key')
+
+def job_to_state(job):
+    state = {k: v for k, v in job.items() if k not in _TRANSIENT_FIELDS}
+    if 'segments' in job:
+        state['segments'] = [{'start': seg.start, 'end': seg.end, 'text': seg.text} for seg in job['segments']]
+    return state
+
+def job_from_state(state):
+    job = dict(state)
+    if 'segments' in job:
+        job['segments'] = [SimpleNamespace(**seg) for seg in job['segments']]
+    return job
+
+class JobStore:
+    """SQLite-backed record of batches, per-video stage progress and job state."""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(WORK_DIR, 'jobs.sqlite')
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS batches ("
+            " batch_id TEXT PRIMARY KEY, created REAL, status TEXT, stats TEXT);"
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " job_id TEXT PRIMARY KEY, batch_id TEXT, position INTEGER, name TEXT,"
+            " status TEXT, stage TEXT, error TEXT, state TEXT, updated REAL);"
+            "CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch_id, position);"
+        )
+        self._conn.commit()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cursor
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def batch_dir(self, batch_id):
+        return os.path.join(os.path.dirname(self.path), batch_id)
+
+    def create_batch(self):
+        batch_id = time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:8]
+        os.makedirs(self.batch_dir(batch_id), exist_ok=True)
+        self._execute("INSERT INTO batches VALUES (?, ?, 'running', NULL)", (batch_id, time.time()))
+        return batch_id
+
+    def add_job(self, batch_id, position, job):
+        job_id = f"{batch_id}-{position}"
+        job['job_id'] = job_id
+        self._execute("INSERT INTO jobs VALUES (?, ?, ?, ?, 'pending', NULL, NULL, ?, ?)",
+                      (job_id, batch_id, position, job['name'], json.dumps(job_to_state(job)), time.time()))
+        return job_id
+
+    def save_checkpoint(self, job, stage):
+        self._execute("UPDATE jobs SET status='running', stage=?, state=?, updated=? WHERE job_id=?",
+                      (stage, json.dumps(job_to_state(job), ensure_ascii=False), time.time(), job['job_id']))
+
+    def finish_job(self, job):
+        status = 'error' if 'error' in job else 'done'
+        self._execute("UPDATE jobs SET status=?, error=?, state=?, updated=? WHERE job_id=?",
+                      (status, job.get('error'), json.dumps(job_to_state(job), ensure_ascii=False),
+                       time.time(), job['job_id']))
+
+    def finish_batch(self, batch_id, stats=None):
+        self._execute("UPDATE batches SET status='done', stats=? WHERE batch_id=?",
+                      (json.dumps(stats) if stats is not None else None, batch_id))
+
+    def batch(self, batch_id):
+        rows = self._query("SELECT * FROM batches WHERE batch_id=?", (batch_id,))
+        if not rows:
+            return None
+        batch = dict(rows[0])
+        batch['stats'] = json.loads(batch['stats']) if batch['stats'] else None
+        return batch
+
+    def jobs(self, batch_id):
+        rows = self._query("SELECT * FROM jobs WHERE batch_id=? ORDER BY position", (batch_id,))
+        jobs = []
+        for row in rows:
+            job = job_from_state(json.loads(row['state']))
+            job.update({'job_id': row['job_id'], 'status': row['status'], 'stage': row['stage']})
+            if row['error']:
+                job['error'] = row['error']
+            jobs.append(job)
+        return jobs
+
+    def unfinished_jobs(self, batch_id):
+        return [job for job in self.jobs(batch_id) if job['status'] in ('pending', 'running')]
+
+    def unfinished_batches(self):
+        return [row['batch_id'] for row in self._query("SELECT batch_id FROM batches WHERE status='running'")]
+
+class JobRunner:
+    """Runs batches in background threads so they outlive Streamlit reruns and sessions."""
+
+    def __init__(self, store, models):
+        self.store = store
+        self.models = models
+        self._lock = threading.Lock()
+        self._threads = {}
+
+    def is_running(self, batch_id):
+        with self._lock:
+            thread = self._threads.get(batch_id)
+            return thread is not None and thread.is_alive()
+
+    def start(self, batch_id, secrets=None):
+        with self._lock:
+            thread = self._threads.get(batch_id)
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=self._run, args=(batch_id, secrets or {}), daemon=True,
+                                      name=f"lote-{batch_id}")
+            self._threads[batch_id] = thread
+            thread.start()
+
+    def resume_all(self):
+        # Al arrancar el proceso retomamos los lotes que quedaron a medias
+        for batch_id in self.store.unfinished_batches():
+            self.start(batch_id)
+
+    def _run(self, batch_id, secrets):
+        from staged_pipeline import StageStats, run_pipelined
+        jobs = self.store.unfinished_jobs(batch_id)
+        for job in jobs:
+            job.setdefault('deepl_api_key', None)
+            job.update(secrets)
+        stats = StageStats()
+        for job in run_pipelined(jobs, self.models, stats=stats, workers={'traduccion': 2, 'informe': 2},
+                                 checkpoint=self.store.save_checkpoint):
+            self.store.finish_job(job)
+        self.store.finish_batch(batch_id, stats.summary())
@@ -0,0 +1,125 @@
+import os
+import threading
+
+# Traducción local sin red: un modelo MarianMT o NLLB convertido a CTranslate2
+# (int8 en CPU) traduce todos los segmentos de un video en lotes grandes, así el
+# throughput depende de los núcleos y no de los límites de los servicios remotos.
+#
+# Conversión (una sola vez, en una máquina con transformers y torch):
+#   ct2-transformers-converter --model facebook/nllb-200-distilled-600M --quantization int8 \
+#       --copy_files tokenizer.json --output_dir models/nllb-200-distilled-600M
+# Los modelos NLLB (tokenizer.json) sirven para cualquier par de idiomas; los Marian
+# (opus-mt-en-es, con --copy_files source.spm target.spm) son un par por modelo y
+# necesitan sentencepiece. La ruta admite {source} y {target}: models/opus-mt-{source}-{target}
+
+LOCAL_MODEL = os.getenv('DOBLADO_LOCAL_MT_MODEL',
+                        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models',
+                                     'nllb-200-distilled-600M'))
+# Segmentos por lote de inferencia (CTranslate2 los ordena por largo dentro de cada llamada)
+BATCH_SIZE = int(os.getenv('LOCAL_MT_BATCH_SIZE', '32'))
+BEAM_SIZE = int(os.getenv('LOCAL_MT_BEAM_SIZE', '2'))
+COMPUTE_TYPE = os.getenv('LOCAL_MT_COMPUTE_TYPE', 'int8')
+THREADS = int(os.getenv('LOCAL_MT_THREADS', '0')) or os.cpu_count() or 1
+
+# Códigos FLORES-200 que usa NLLB para cada idioma
+NLLB_CODES = {
+    'en': 'eng_Latn', 'es': 'spa_Latn', 'pt': 'por_Latn', 'fr': 'fra_Latn',
+    'it': 'ita_Latn', 'de': 'deu_Latn', 'ca': 'cat_Latn', 'gl': 'glg_Latn',
+}
+
+def model_path(source, target, path=LOCAL_MODEL):
+    return path.format(source=source, target=target)
+
+def model_name(source, target, path=LOCAL_MODEL):
+    # Identifica el modelo en el cache de traducciones: cambiar de modelo no reutiliza las viejas
+    return os.path.basename(os.path.normpath(model_path(source, target, path)))
+
+class LocalModel:
+    """A CTranslate2 translation model with its tokenizer, shared by every job."""
+
+    def __init__(self, path):
+        import ctranslate2
+        self.translator = ctranslate2.Translator(path, device='cpu', compute_type=COMPUTE_TYPE,
+                                                 inter_threads=1, intra_threads=THREADS)
+        # Una traducción a la vez usando todos los hilos; los lotes ya vienen grandes
+        self._lock = threading.Lock()
+        self.tokenizer = None
+        if os.path.exists(os.path.join(path, 'tokenizer.json')):
+            # tokenizers ya viene con faster-whisper
+            from tokenizers import Tokenizer
+            self.tokenizer = Tokenizer.from_file(os.path.join(path, 'tokenizer.json'))
+            self.nllb = self.tokenizer.token_to_id(NLLB_CODES['en']) is not None
+        else:
+            import sentencepiece
+            self.source_spm = sentencepiece.SentencePieceProcessor(model_file=os.path.join(path, 'source.spm'))
+            self.target_spm = sentencepiece.SentencePieceProcessor(model_file=os.path.join(path, 'target.spm'))
+            self.nllb = False
+
+    def encode(self, text):
+        if self.tokenizer is not None:
+            return self.tokenizer.encode(text, add_special_tokens=False).tokens
+        return self.source_spm.encode(text, out_type=str)
+
+    def decode(self, tokens):
+        if self.tokenizer is not None:
+            ids = [self.tokenizer.token_to_id(token) for token in tokens]
+            return self.tokenizer.decode([i for i in ids if i is not None])
+        return self.target_spm.decode(tokens)
+
+    def translate_batch(self, texts, source, target):
+        if self.nllb:
+            if source not in NLLB_CODES or target not in NLLB_CODES:
+                raise ValueError(f"NLLB: idioma sin código FLORES configurado ({source}->{target})")
+            tokens = [[NLLB_CODES[source]] + self.encode(text) + ['</s>'] for text in texts]
+            prefix = [[NLLB_CODES[target]]] * len(texts)
+        else:
+            tokens = [self.encode(text) + ['</s>'] for text in texts]
+            prefix = None
+        with self._lock:
+            results = self.translator.translate_batch(tokens, target_prefix=prefix, max_batch_size=BATCH_SIZE,
+                                                      beam_size=BEAM_SIZE)
+        translated = []
+        for result in results:
+            hypothesis = result.hypotheses[0]
+            if self.nllb and hypothesis[:1] == [NLLB_CODES[target]]:
+                hypothesis = hypothesis[1:]
+            translated.append(self.decode([token for token in hypothesis if token != '</s>']).strip())
+        return translated
+
+_models = {}
+_models_lock = threading.Lock()
+
+def get_local_model(path):
+    """Return the loaded model at path, loading it on first use."""
+    with _models_lock:
+        model = _models.get(path)
+        if model is None:
+            if not os.path.isdir(path):
+                # Sin modelo, SegmentTranslator cae al proveedor alternativo: que quede en el log
+                print(f"No existe el modelo de traducción local {path}; ver local_translation.py para convertirlo")
+                raise FileNotFoundError(path)
+            model = _models[path] = LocalModel(path)
+        return model
+
+class LocalTranslator:
+    """Same interface as the deep_translator translators, backed by a local model."""
+
+    def __init__(self, source='en', target='es', path=LOCAL_MODEL):
+        self.source = source
+        self.target = target
+        self.path = model_path(source, target, path)
+
+    def translate_batch(self, batch):
+        texts = list(batch)
+        # Las líneas vacías no pasan por el modelo
+        filled = [i for i, text in enumerate(texts) if text.strip()]
+        if filled:
+            translated = get_local_model(self.path).translate_batch([texts[i] for i in filled],
+                                                                    self.source, self.target)
+            for i, text in zip(filled, translated):
+                texts[i] = text
+        return texts
+
+    def translate(self, text):
+        # Un texto por línea, como los lotes que arma SegmentTranslator
+        return "\n".join(self.translate_batch(text.split("\n")))
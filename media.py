@@ -0,0 +1,155 @@
+import os
+import re
+import shutil
+import tempfile
+import subprocess
+import numpy as np
+import tracing
+
+# Utilidades de ffmpeg compartidas por las etapas de audio y video.
+
+def ffmpeg_exe():
+    # Igual que moviepy: variable de entorno, ffmpeg del sistema o el binario de imageio-ffmpeg
+    exe = os.getenv('FFMPEG_BINARY') or shutil.which('ffmpeg')
+    if exe:
+        return exe
+    import imageio_ffmpeg
+    return imageio_ffmpeg.get_ffmpeg_exe()
+
+def run_ffmpeg(args, input_bytes=None):
+    cmd = [ffmpeg_exe(), '-hide_banner', '-loglevel', 'error', '-nostdin', '-y'] + list(args)
+    if input_bytes is not None:
+        cmd.remove('-nostdin')
+    result = subprocess.run(cmd, input=input_bytes, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg falló: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return result.stdout
+
+def atempo_chain(tempo):
+    # atempo solo acepta factores entre 0.5 y 2.0 en versiones viejas de ffmpeg: encadenamos
+    filters = []
+    while tempo > 2.0:
+        filters.append("atempo=2.0")
+        tempo /= 2.0
+    filters.append(f"atempo={tempo:.5f}")
+    return ",".join(filters)
+
+def decode_pcm(path, sample_rate, tempo=None):
+    """Decode any audio file to a mono int16 numpy array at sample_rate."""
+    args = ['-i', path, '-vn', '-ac', '1', '-ar', str(sample_rate)]
+    if tempo:
+        args += ['-filter:a', atempo_chain(tempo)]
+    args += ['-f', 's16le', '-acodec', 'pcm_s16le', 'pipe:1']
+    return np.frombuffer(run_ffmpeg(args), dtype=np.int16)
+
+def encode_pcm(samples, sample_rate, output_path):
+    """Encode a mono int16 numpy array to output_path (codec chosen by extension)."""
+    args = ['-f', 's16le', '-ar', str(sample_rate), '-ac', '1', '-i', 'pipe:0', output_path]
+    run_ffmpeg(args, input_bytes=np.ascontiguousarray(samples, dtype=np.int16).tobytes())
+
+def probe_duration(path):
+    """Return the container duration in seconds as reported by ffmpeg, or None."""
+    cmd = [ffmpeg_exe(), '-hide_banner', '-nostdin', '-i', path]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    match = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr.decode('utf-8', 'replace'))
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+@tracing.traced('ffmpeg.mezcla')
+def mux_audio_copy(video_path, audio_path, output_path):
+    """Replace the audio track of video_path without re-encoding the video stream.
+
+    The new audio is padded with silence or cut so the output keeps the
+    original video length. Raises RuntimeError if the video stream cannot be
+    copied into the output container.
+    """
+    mux_audio_tracks(video_path, [(audio_path, None, None)], output_path)
+
+def mux_audio_tracks(video_path, tracks, output_path):
+    """Like mux_audio_copy with one audio track per (audio_path, language, title).
+
+    language is an ISO 639-2 code (e.g. 'spa') that players show in their
+    audio track menu; the first track is the default one.
+    """
+    duration = probe_duration(video_path)
+    if duration is None:
+        raise RuntimeError(f"no se pudo leer la duración de {video_path}")
+    args = ['-i', video_path]
+    for audio_path, _, _ in tracks:
+        args += ['-i', audio_path]
+    args += ['-map', '0:v:0']
+    for index in range(len(tracks)):
+        args += ['-map', f"{index + 1}:a:0"]
+    args += ['-c:v', 'copy', '-c:a', 'aac', '-b:a', '192k']
+    for index, (_, language, title) in enumerate(tracks):
+        if language:
+            args += [f"-metadata:s:a:{index}", f"language={language}"]
+        if title:
+            # MP4 guarda el nombre de la pista en handler_name; title lo usan otros contenedores
+            args += [f"-metadata:s:a:{index}", f"title={title}", f"-metadata:s:a:{index}", f"handler_name={title}"]
+        if len(tracks) > 1:
+            args += [f"-disposition:a:{index}", 'default' if index == 0 else '0']
+    args += [
+        # apad + -t: rellena con silencio si el audio es más corto y lo corta si es más largo
+        '-af', 'apad', '-t', f"{duration:.3f}",
+        '-movflags', '+faststart',
+        output_path,
+    ]
+    run_ffmpeg(args)
+
+@tracing.traced('ffmpeg.extraer_audio')
+def extract_audio(video_path, output_path, sample_rate=16000):
+    """Decode the audio track once to raw mono float32 PCM (the format Whisper expects)."""
+    args = ['-i', video_path, '-vn', '-ac', '1', '-ar', str(sample_rate),
+            '-f', 'f32le', '-acodec', 'pcm_f32le', output_path]
+    run_ffmpeg(args)
+    return output_path
+
+def load_audio(path):
+    # Memory-mapped: los archivos largos no se cargan enteros en RAM
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.memmap(path, dtype=np.float32, mode='r')
+
+def encode_frame_runs(images, runs, fps, output_path, audio_path=None):
+    """Encode a video from a few still images shown in runs, without temp frames.
+
+    images is a uint8 array (n, height, width, 3) with even height and width;
+    runs is an iterable of (image_index, frame_count). Raw frames are piped
+    to ffmpeg straight from the arrays, so memory stays constant whatever
+    the length of the video; repeated frames are dropped before encoding.
+    """
+    runs = [tuple(run) for run in runs if run[1] > 0]
+    # mpdecimate descarta los frames idénticos al anterior (framerate variable): x264 solo
+    # codifica los cambios de boca y el archivo sale más chico. El último frame del video
+    # lo agrega tpad al final del stream, si no el último tramo duraría un solo frame
+    pad = 0
+    if runs and runs[-1][1] > 1:
+        runs[-1] = (runs[-1][0], runs[-1][1] - 1)
+        pad = 1
+    height, width = images.shape[1:3]
+    args = ['-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f"{width}x{height}", '-r', str(fps), '-i', 'pipe:0']
+    if audio_path:
+        args += ['-i', audio_path, '-map', '0:v:0', '-map', '1:a:0', '-c:a', 'aac']
+    # Sin B-frames: con framerate variable el mp4 calcularía mal la duración
+    args += ['-vf', f"mpdecimate=hi=1:lo=1:frac=1:max=0,tpad=stop_mode=clone:stop={pad}", '-fps_mode', 'vfr',
+             '-c:v', 'libx264', '-tune', 'stillimage', '-bf', '0', '-pix_fmt', 'yuv420p', output_path]
+    cmd = [ffmpeg_exe(), '-hide_banner', '-loglevel', 'error', '-y'] + args
+    frames = [memoryview(np.ascontiguousarray(image)).cast('B') for image in images]
+    # stderr a un archivo: un pipe que nadie lee mientras se escriben los frames se llena
+    # con los warnings de un render largo y ffmpeg y este proceso se bloquean mutuamente
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr)
+        try:
+            for index, count in runs:
+                frame = frames[index]
+                for _ in range(count):
+                    process.stdin.write(frame)
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        if process.wait() != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"ffmpeg falló: {stderr.read().decode('utf-8', 'replace').strip()}")
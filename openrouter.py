@@ -0,0 +1,336 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import asyncio
+import hashlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+import tracing
+
+# Cliente compartido de OpenRouter para informes, JSON, chatbot y consejos del
+# avatar: reutiliza conexiones (keep-alive), limita la tasa de requests con un
+# token bucket, reintenta los 429/5xx con backoff exponencial con jitter y
+# guarda las respuestas en un cache SQLite indexado por el hash del prompt.
+# La variante async permite lanzar muchas llamadas en paralelo sin ser limitados.
+
+OPENROUTER_URL = os.getenv('OPENROUTER_URL', "https://openrouter.ai/api/v1/chat/completions")
+DEFAULT_MODEL = os.getenv('OPENROUTER_MODEL', "x-ai/grok-4.1-fast:free")
+# Los modelos gratuitos de OpenRouter permiten unas 20 requests por minuto
+RATE_PER_MINUTE = float(os.getenv('OPENROUTER_RATE_PER_MINUTE', '20'))
+BURST = int(os.getenv('OPENROUTER_BURST', '4'))
+MAX_CONCURRENT = int(os.getenv('OPENROUTER_MAX_CONCURRENT', '4'))
+MAX_RETRIES = int(os.getenv('OPENROUTER_MAX_RETRIES', '4'))
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 60.0
+CACHE_DAYS = float(os.getenv('OPENROUTER_CACHE_DAYS', '30'))
+CACHE_DIR = os.getenv('DOBLADO_CACHE_DIR', '.cache')
+
+RETRY_STATUS = (408, 409, 425, 429, 500, 502, 503, 504)
+
+class OpenRouterError(RuntimeError):
+    pass
+
+class TokenBucket:
+    """Thread-safe token bucket shared by the sync and async clients."""
+
+    def __init__(self, rate_per_minute=RATE_PER_MINUTE, burst=BURST):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take one token and return how many seconds the caller must wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0 or self.rate <= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+class ResponseCache:
+    """SQLite cache of completions keyed by the hash of model, messages and parameters."""
+
+    def __init__(self, path=None, max_age_days=CACHE_DAYS):
+        self.path = path or os.path.join(CACHE_DIR, 'openrouter.sqlite')
+        self.max_age = max_age_days * 86400
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, created REAL, content TEXT)")
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT created, content FROM responses WHERE key=?", (key,)).fetchone()
+        if row is None or (self.max_age and time.time() - row[0] > self.max_age):
+            return None
+        return row[1]
+
+    def put(self, key, content):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, time.time(), content))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+def prompt_key(model, messages, params):
+    payload = json.dumps([model, messages, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def backoff_delay(attempt, retry_after=None):
+    # Respetamos Retry-After si viene; si no, backoff exponencial con "full jitter"
+    if retry_after:
+        try:
+            return min(MAX_BACKOFF_SECONDS, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2 ** attempt))
+
+def _content(result):
+    try:
+        return result['choices'][0]['message']['content']
+    except (KeyError, IndexError, TypeError):
+        raise OpenRouterError(f"respuesta inesperada de OpenRouter: {str(result)[:200]}")
+
+class OpenRouterClient:
+    """Pooled, rate-limited, retrying OpenRouter chat client."""
+
+    def __init__(self, api_key=None, model=DEFAULT_MODEL, url=OPENROUTER_URL, bucket=None, cache=None,
+                 max_retries=MAX_RETRIES, max_concurrent=MAX_CONCURRENT, timeout=60):
+        self._api_key = api_key
+        self.model = model
+        self.url = url
+        self.bucket = bucket or get_bucket()
+        self.cache = cache
+        self.max_retries = max_retries
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    @property
+    def api_key(self):
+        # Se lee en cada llamada: la clave puede cargarse del .env después de crear el cliente
+        return self._api_key or os.getenv('OPEN_ROUTE_API')
+
+    @property
+    def available(self):
+        return bool(self.api_key)
+
+    def _headers(self):
+        return {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+
+    def _cached(self, model, messages, params, use_cache):
+        if not use_cache or self.cache is None:
+            return None, None
+        key = prompt_key(model, messages, params)
+        content = self.cache.get(key)
+        if content is not None:
+            tracing.set_attrs(cache=True)
+        return key, content
+
+    def _post(self, data, timeout=None, stream=False):
+        """POST with rate limiting and retries; returns the first successful response."""
+        last_error, delay = None, 0.0
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                # Sin espera después del último intento
+                tracing.add_retry()
+                time.sleep(delay)
+            self.bucket.acquire()
+            try:
+                with self._semaphore:
+                    response = self.session.post(self.url, headers=self._headers(), json=data,
+                                                 timeout=timeout or self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = e
+                delay = backoff_delay(attempt)
+                continue
+            sent = len(response.request.body or b'')
+            if response.status_code >= 400:
+                tracing.add_bytes(sent=sent, received=len(response.content))
+                error = OpenRouterError(f"HTTP {response.status_code}: {response.text[:200]}")
+                if response.status_code not in RETRY_STATUS:
+                    raise error
+                last_error = error
+                delay = backoff_delay(attempt, response.headers.get('Retry-After'))
+                continue
+            # En streaming los bytes recibidos los cuenta quien consume la respuesta
+            tracing.add_bytes(sent=sent, received=0 if stream else len(response.content))
+            return response
+        raise OpenRouterError(f"OpenRouter no respondió tras {self.max_retries + 1} intentos: {last_error}")
+
+    def chat(self, messages, model=None, use_cache=True, timeout=None, **params):
+        """Send a chat completion and return the message content; raises OpenRouterError."""
+        if not self.available:
+            raise OpenRouterError("falta la clave API de OpenRouter (OPEN_ROUTE_API)")
+        model = model or self.model
+        key, cached = self._cached(model, messages, params, use_cache)
+        if cached is not None:
+            return cached
+        response = self._post(dict(params, model=model, messages=messages), timeout)
+        content = _content(response.json())
+        if key:
+            self.cache.put(key, content)
+        return content
+
+    def stream_chat(self, messages, model=None, use_cache=True, timeout=None, **params):
+        """Yield the completion content piece by piece as OpenRouter streams it (SSE)."""
+        if not self.available:
+            raise OpenRouterError("falta la clave API de OpenRouter (OPEN_ROUTE_API)")
+        model = model or self.model
+        key, cached = self._cached(model, messages, params, use_cache)
+        if cached is not None:
+            yield cached
+            return
+        response = self._post(dict(params, model=model, messages=messages, stream=True), timeout, stream=True)
+        parts = []
+        # SSE es UTF-8 por especificación, pero OpenRouter no manda charset y requests asumiría ISO-8859-1
+        response.encoding = 'utf-8'
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                # Las líneas que empiezan con ":" son comentarios de keep-alive
+                if not line or not line.startswith('data:'):
+                    continue
+                payload = line[5:].strip()
+                if payload == '[DONE]':
+                    break
+                tracing.add_bytes(received=len(payload))
+                chunk = json.loads(payload)
+                if 'error' in chunk:
+                    raise OpenRouterError(f"error en el streaming de OpenRouter: {chunk['error']}")
+                delta = (chunk.get('choices') or [{}])[0].get('delta', {}).get('content')
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        if key:
+            self.cache.put(key, ''.join(parts))
+
+    def complete(self, prompt, **kwargs):
+        return self.chat([{"role": "user", "content": prompt}], **kwargs)
+
+    def stream(self, prompt, **kwargs):
+        return self.stream_chat([{"role": "user", "content": prompt}], **kwargs)
+
+class AsyncOpenRouterClient(OpenRouterClient):
+    """Async variant (aiohttp) sharing the token bucket and cache; use as ``async with``."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._http = None
+        self._async_semaphore = None
+
+    async def __aenter__(self):
+        import aiohttp
+        connector = aiohttp.TCPConnector(limit=self.max_concurrent)
+        self._http = aiohttp.ClientSession(connector=connector,
+                                           timeout=aiohttp.ClientTimeout(total=self.timeout))
+        self._async_semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._http.close()
+        self._http = None
+
+    async def achat(self, messages, model=None, use_cache=True, timeout=None, **params):
+        import aiohttp
+        if not self.available:
+            raise OpenRouterError("falta la clave API de OpenRouter (OPEN_ROUTE_API)")
+        model = model or self.model
+        key, cached = self._cached(model, messages, params, use_cache)
+        if cached is not None:
+            return cached
+        data = dict(params, model=model, messages=messages)
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        # El timeout es del request, no va en el cuerpo ni en la clave de cache
+        request_timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        last_error, delay = None, 0.0
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                tracing.add_retry()
+                await asyncio.sleep(delay)
+            await self.bucket.acquire_async()
+            try:
+                async with self._async_semaphore:
+                    async with self._http.post(self.url, headers=self._headers(), data=body,
+                                               timeout=request_timeout) as response:
+                        payload = await response.read()
+                        status, retry_after = response.status, response.headers.get('Retry-After')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = e
+                delay = backoff_delay(attempt)
+                continue
+            tracing.add_bytes(sent=len(body), received=len(payload))
+            text = payload.decode('utf-8', 'replace')
+            if status in RETRY_STATUS:
+                last_error = OpenRouterError(f"HTTP {status}: {text[:200]}")
+                delay = backoff_delay(attempt, retry_after)
+                continue
+            if status >= 400:
+                raise OpenRouterError(f"HTTP {status}: {text[:200]}")
+            content = _content(json.loads(text))
+            if key:
+                self.cache.put(key, content)
+            return content
+        raise OpenRouterError(f"OpenRouter no respondió tras {self.max_retries + 1} intentos: {last_error}")
+
+    async def acomplete(self, prompt, **kwargs):
+        return await self.achat([{"role": "user", "content": prompt}], **kwargs)
+
+_default_bucket = None
+_default_client = None
+_default_cache = None
+_default_lock = threading.Lock()
+
+def get_bucket():
+    global _default_bucket
+    with _default_lock:
+        if _default_bucket is None:
+            _default_bucket = TokenBucket()
+        return _default_bucket
+
+def get_response_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
+
+def get_client():
+    """Process-wide client: every LLM feature shares its connections and rate limit."""
+    global _default_client
+    cache = get_response_cache()
+    bucket = get_bucket()
+    with _default_lock:
+        if _default_client is None:
+            _default_client = OpenRouterClient(bucket=bucket, cache=cache)
+        return _default_client
+
+def async_client(**kwargs):
+    kwargs.setdefault('bucket', get_bucket())
+    kwargs.setdefault('cache', get_response_cache())
+    return AsyncOpenRouterClient(**kwargs)
@@ -0,0 +1,705 @@
+import os
+import time
+import shutil
+import tempfile
+import asyncio
+import json
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta, datetime
+from translation import SegmentTranslator, TRANSLATION_PROVIDER, select_provider, provider_key
+from config import transcribe_options as default_transcribe_options
+from whisper_pool import select_model_size, DEFAULT_TIER
+from artifact_cache import get_artifact_cache, file_digest, make_key
+from chat_index import ChatIndex, citation, TOP_K
+from glossary import get_glossary
+import tracing
+
+# Núcleo del pipeline de doblaje, sin dependencias de Streamlit para poder
+# usarlo tanto desde la interfaz (app.py) como desde el modo batch (doblado.py).
+# Los módulos pesados (numpy, edge-tts, requests, moviepy, faster-whisper, fpdf,
+# phonemizer) se importan dentro de la etapa que los usa: importar este módulo
+# es barato y la interfaz arranca sin pagar por etapas que quizá no corran.
+
+def format_timestamp(seconds):
+    td = timedelta(seconds=seconds)
+    # Formato simple para SRT: HH:MM:SS,mmm
+    total_seconds = int(td.total_seconds())
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    secs = total_seconds % 60
+    millis = int(td.microseconds / 1000)
+    return f"{hours:02}:{minutes:02}:{secs:02},{millis:03}"
+
+# Voz neuronal de Microsoft (Español Argentino)
+VOICE = "es-AR-TomasNeural" # Opciones: es-MX-DaliaNeural, es-ES-AlvaroNeural
+
+# Modelo de OpenRouter usado para informes, JSON y chatbot
+REPORT_MODEL = "x-ai/grok-4.1-fast:free"
+
+@tracing.traced('tts.voz')
+async def generate_voice_over(text_segments, output_audio_path, aligned=False, voice=VOICE):
+    """Synthesize the dubbed track and return its words with start/end in track time."""
+    from tts import generate_aligned_voice_over, save_with_words, read_word_boundaries, place_words
+    if aligned:
+        # Un clip por segmento, sintetizados en paralelo y ubicados en su timestamp
+        return await generate_aligned_voice_over(text_segments, output_audio_path, voice)
+    full_text = " ".join([seg['text'] for seg in text_segments])
+    metadata_path = output_audio_path + '.words.jsonl'
+    await save_with_words(full_text, voice, output_audio_path, metadata_path)
+    clip_words = read_word_boundaries(metadata_path)
+    os.remove(metadata_path)
+    end = clip_words[-1][0] + clip_words[-1][1] if clip_words else 0
+    return place_words({'text': full_text}, clip_words, 0.0, end, 1.0)
+
+def create_srt(segments, output_path):
+    with open(output_path, "w", encoding="utf-8") as f:
+        for i, seg in enumerate(segments, start=1):
+            start = format_timestamp(seg['start'])
+            end = format_timestamp(seg['end'])
+            text = seg['text']
+            f.write(f"{i}\n{start} --> {end}\n{text}\n\n")
+
+# Los reemplazos para un español argentino más natural y los términos de cannabis,
+# química y cultivo viven en glosario/*.tsv (ver glossary.py)
+def post_process_text(text, glossary=None):
+    return (glossary or get_glossary()).apply(text)
+
+REPORT_INSTRUCTIONS = """
+                    Basado en el siguiente transcripto de un video, genera un informe estructurado en formato Markdown.
+                    Organiza la información en secciones lógicas con títulos y subtítulos claros.
+                    Incluye un resumen al inicio.
+                    Asegúrate de que el informe sea coherente, bien estructurado y capture los puntos clave del contenido.
+                    """
+
+@tracing.traced('openrouter.informe')
+def generate_report(texts, segments=None, on_update=None):
+    """Generate a structured report from the transcript texts using OpenRoute AI.
+
+    Long transcripts are summarized by windows in parallel and then combined
+    (see chunked_report). ``on_update(partial_markdown)`` streams the result.
+    """
+    # Concatenate all texts
+    full_text = ' '.join(texts)
+
+    # Configure OpenRoute
+    from openrouter import get_client
+    from chunked_report import build_report
+    client = get_client()
+    if client.available:
+        try:
+            report = build_report(texts, REPORT_INSTRUCTIONS, REPORT_MODEL, segments=segments,
+                                  on_update=on_update, client=client)
+        except Exception as e:
+            print(f"No se pudo generar el informe con OpenRouter: {e}")
+            report = f"Error generando informe con IA: {str(e)}. Usando lógica básica.\n\n# Informe\n\n{full_text}"
+    else:
+        # Fallback to basic logic if no API key
+        report = f"# Informe del Video\n\n## Resumen\n\nResumen del contenido del video.\n\n## Contenido Completo\n\n{full_text}"
+
+    return report
+
+def generate_pdf(text):
+    from fpdf import FPDF
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+    lines = text.split('\n')
+    for line in lines:
+        if line.startswith('# '):
+            pdf.set_font("Arial", 'B', 16)
+            pdf.multi_cell(0, 10, line[2:])
+            pdf.set_font("Arial", size=12)
+        elif line.startswith('## '):
+            pdf.set_font("Arial", 'B', 14)
+            pdf.multi_cell(0, 10, line[3:])
+            pdf.set_font("Arial", size=12)
+        elif line.strip() == '':
+            pdf.ln(10)
+        else:
+            pdf.multi_cell(0, 10, line)
+    # fpdf 1.7 devuelve el PDF como str latin-1: lo pasamos a bytes tal cual
+    return pdf.output(dest='S').encode('latin-1')
+
+# Cambia cuando cambia la estructura del JSON: invalida los JSON cacheados
+JSON_FORMAT_VERSION = 2
+
+@tracing.traced('openrouter.json')
+def generate_json(original_segments, translated_segments, report_md, srt_content, video_name):
+    """Generate structured JSON from video data using Grok for professional expansion.
+
+    Only the report goes to the model (it already condenses the transcript);
+    transcripts and subtitles are attached locally instead of being sent and
+    echoed back by the model.
+    """
+    json_data = {
+        "metadata": {
+            "video_name": video_name,
+            "processing_timestamp": datetime.now().isoformat(),
+            "source": "AI Video Dubber"
+        },
+        "transcripts": {
+            "original": [{"start": seg.start, "end": seg.end, "text": seg.text} for seg in original_segments],
+            "translated": translated_segments
+        },
+        "subtitles": srt_content,
+        "report": report_md,
+    }
+
+    # Use Grok to structure and expand
+    from openrouter import get_client
+    client = get_client()
+    if client.available:
+        prompt = f"""
+        Based on the following video report, generate a professional, structured JSON object optimized for LLM consumption.
+        Expand the information where appropriate with additional context, key topics, entities, and structured summaries.
+        Include sections for analysis and expanded insights. Transcripts and subtitles are attached separately: do not repeat them.
+
+        Video: {video_name}
+        Report: {report_md}
+
+        Return only valid JSON without any markdown formatting or explanations.
+        """
+
+        try:
+            json_str = client.complete(prompt, model=REPORT_MODEL, timeout=60).strip()
+            # Remove any potential markdown code blocks
+            if json_str.startswith('```json'):
+                json_str = json_str[7:]
+            if json_str.endswith('```'):
+                json_str = json_str[:-3]
+            json_data["analysis"] = json.loads(json_str)
+        except Exception as e:
+            # Fallback to basic JSON structure
+            json_data = {
+                "error": f"Failed to generate enhanced JSON with AI: {str(e)}",
+                "fallback_data": json_data
+            }
+    else:
+        # Fallback without API
+        json_data["note"] = "Enhanced structuring requires OPEN_ROUTE_API key"
+
+    return json.dumps(json_data, ensure_ascii=False, indent=2)
+
+@tracing.traced('openrouter.chatbot')
+def ask_chatbot(question, full_report=None, index=None, k=TOP_K):
+    """Ask questions about the full report using the same AI model.
+
+    With a chat_index.ChatIndex only the k most relevant transcript and report
+    chunks are sent, with video/timestamp citations, instead of the full report.
+    """
+    from openrouter import get_client
+    client = get_client()
+    if client.available and index is not None:
+        hits = index.search(question, k)
+        tracing.set_attrs(fragmentos=len(hits))
+        if not hits:
+            return "No encontré información sobre eso en los informes de los videos cargados."
+        context = "\n\n".join(f"[{i}] ({citation(chunk)})\n{chunk['text']}"
+                                for i, (_, chunk) in enumerate(hits, start=1))
+        prompt = f"""
+                    Responde la pregunta del usuario de manera clara, concisa y precisa usando solo los fragmentos de abajo,
+                    extraídos de las transcripciones y los informes de los videos. Cita los fragmentos que uses con su número, por ejemplo [2].
+                    Si los fragmentos no alcanzan para responder, dilo.
+
+                    Fragmentos:
+                    {context}
+
+                    Pregunta: {question}
+                    """
+        try:
+            answer = client.complete(prompt, model=REPORT_MODEL, timeout=30)
+        except Exception as e:
+            return f"Error consultando al chatbot: {str(e)}. Intenta de nuevo."
+        sources = "\n".join(f"- [{i}] {citation(chunk)}" for i, (_, chunk) in enumerate(hits, start=1))
+        return f"{answer}\n\n**Fuentes:**\n{sources}"
+    if client.available:
+        prompt = f"""
+                    Basado en el siguiente informe completo, responde a la pregunta del usuario de manera clara, concisa y precisa.
+                    Si la pregunta no está relacionada con el contenido del informe, indica que no puedes responder sobre temas fuera del informe.
+
+                    Informe completo:
+                    {full_report}
+
+                    Pregunta: {question}
+                    """
+
+        try:
+            answer = client.complete(prompt, model=REPORT_MODEL, timeout=30)
+        except Exception as e:
+            answer = f"Error consultando al chatbot: {str(e)}. Intenta de nuevo."
+    else:
+        answer = "No se puede acceder al chatbot porque falta la clave API de OpenRoute."
+
+    return answer
+
+# --- PASOS DEL PIPELINE ---
+
+@tracing.traced('whisper.transcripcion')
+def transcribe(model, audio, options=None):
+    options = options or default_transcribe_options()
+    kwargs = {
+        'language': "en",
+        'beam_size': options['beam_size'],
+        'vad_filter': options['vad_filter'],
+    }
+    if options['vad_filter']:
+        kwargs['vad_parameters'] = {'min_silence_duration_ms': options['vad_min_silence_ms']}
+    if options['batch_size'] > 0:
+        from faster_whisper import BatchedInferencePipeline
+        segments_gen, _ = BatchedInferencePipeline(model=model).transcribe(
+            audio, batch_size=options['batch_size'], **kwargs)
+    else:
+        segments_gen, _ = model.transcribe(audio, **kwargs)
+    tracing.add_bytes(sent=getattr(audio, 'nbytes', 0))
+    segments = list(segments_gen)
+    tracing.set_attrs(segmentos=len(segments))
+    return segments
+
+def translate_segments(segments, deepl_api_key=None, provider=None, target='es'):
+    translator = SegmentTranslator(deepl_api_key=deepl_api_key, source='en', target=target, provider=provider)
+    translated_texts = translator.translate([seg.text for seg in segments])
+    # El glosario es de español rioplatense: los demás idiomas quedan como los tradujo el proveedor
+    glossary = get_glossary() if target == 'es' else None
+    translated_segments = []
+    for seg, translated_text in zip(segments, translated_texts):
+        if glossary:
+            translated_text = post_process_text(translated_text, glossary)
+        translated_segments.append({
+            "start": seg.start,
+            "end": seg.end,
+            "text": translated_text
+        })
+    return translated_segments
+
+def mux_video(video_path, audio_path, output_path):
+    # Copiamos el stream de video tal cual y solo codificamos el audio nuevo
+    from media import mux_audio_copy
+    try:
+        mux_audio_copy(video_path, audio_path, output_path)
+        return
+    except Exception as e:
+        print(f"No se pudo copiar el video sin recodificar ({e}); usando moviepy")
+    mux_video_reencode(video_path, audio_path, output_path)
+
+@tracing.traced('ffmpeg.mezcla_recodificada')
+def mux_video_reencode(video_path, audio_path, output_path):
+    # moviepy solo se carga en este fallback: su import tarda más de un segundo
+    from moviepy import VideoFileClip, AudioFileClip
+    video_clip = VideoFileClip(video_path)
+    new_audio = AudioFileClip(audio_path)
+    if new_audio.duration > video_clip.duration:
+        new_audio = new_audio.subclipped(0, video_clip.duration)
+    final_clip = video_clip.with_audio(new_audio)
+    final_clip.write_videofile(output_path, codec="libx264", audio_codec="aac", logger=None)
+    video_clip.close()
+    new_audio.close()
+
+def output_names(original_name, output_dir="."):
+    name_without_ext = os.path.splitext(os.path.basename(original_name))[0]
+    return {
+        'video': os.path.join(output_dir, f"{name_without_ext} - español.mp4"),
+        'srt': os.path.join(output_dir, f"{name_without_ext} - español.srt"),
+        'report': f"{name_without_ext} - informe.md",
+        'json': f"{name_without_ext} - data.json",
+        'trace': f"{name_without_ext} - traza.json",
+        'index': os.path.join(output_dir, f"{name_without_ext} - indice.json"),
+        'avatar': os.path.join(output_dir, f"{name_without_ext} - avatar.mp4"),
+    }
+
+# Destinos del doblaje: pares (idioma, voz de edge-tts). Se transcribe una sola vez;
+# la traducción y el SRT se hacen una vez por idioma y la voz y la mezcla una vez por
+# destino, todos en paralelo. El primero es el principal: usa los nombres de siempre
+# y es el que alimenta el avatar, el informe y el chatbot.
+DEFAULT_TARGETS = [('es', VOICE)]
+# Código ISO 639-2 de cada idioma para las pistas de audio del MP4
+AUDIO_LANGUAGES = {'es': 'spa', 'pt': 'por', 'en': 'eng', 'fr': 'fra', 'it': 'ita', 'de': 'deu',
+                   'ca': 'cat', 'gl': 'glg'}
+
+def target_id(target):
+    # Variante de la voz ('es-MX-DaliaNeural' -> 'es-MX'): dos voces del mismo idioma no se pisan
+    language, voice = target
+    return '-'.join(voice.split('-')[:2])
+
+def validate_targets(targets):
+    """Return targets without repeats; raise ValueError if two of them share an id."""
+    targets = list(dict.fromkeys(tuple(target) for target in targets))
+    ids = {}
+    for target in targets:
+        # El id nombra archivos y etapas de cache: dos voces del mismo locale se pisarían
+        other = ids.setdefault(target_id(target), target)
+        if other != target:
+            raise ValueError(f"los destinos {':'.join(other)} y {':'.join(target)} comparten la variante "
+                             f"'{target_id(target)}'; se admite una voz por variante")
+    return targets
+
+def dub_names(original_name, output_dir, suffix):
+    name_without_ext = os.path.splitext(os.path.basename(original_name))[0]
+    return {
+        'video': os.path.join(output_dir, f"{name_without_ext} - {suffix}.mp4"),
+        'srt': os.path.join(output_dir, f"{name_without_ext} - {suffix}.srt"),
+    }
+
+def job_targets(job):
+    # Los trabajos guardados antes de existir los destinos solo tienen el español
+    return [tuple(target) for target in job.get('targets') or DEFAULT_TARGETS]
+
+def for_each(func, items):
+    """Run func over items, one thread each, and return the results in order."""
+    if len(items) < 2:
+        return [func(item) for item in items]
+    with ThreadPoolExecutor(max_workers=len(items)) as pool:
+        return list(pool.map(tracing.propagate(func), items))
+
+def new_job(video_path, original_name, output_dir=".", deepl_api_key=None,
+            generate_avatar=False, tag=0, aligned_tts=True, transcribe_options=None,
+            whisper_model='auto', accuracy_tier=DEFAULT_TIER, use_cache=True, avatar_size=None,
+            translator=None, targets=None, multi_audio=False):
+    targets = validate_targets(targets or DEFAULT_TARGETS)
+    names = output_names(original_name, output_dir)
+    if targets[0] != DEFAULT_TARGETS[0]:
+        names.update(dub_names(original_name, output_dir, target_id(targets[0])))
+    return {
+        'video_path': video_path,
+        'name': original_name,
+        'output_dir': output_dir,
+        'deepl_api_key': deepl_api_key,
+        # Proveedor de traducción: 'auto' (DeepL o Google), 'google', 'deepl' o 'local' (sin red)
+        'translator': translator or TRANSLATION_PROVIDER,
+        'generate_avatar': generate_avatar,
+        # (ancho, alto) del video de avatar; None mantiene el tamaño de la imagen
+        'avatar_size': avatar_size,
+        'tag': tag,
+        'aligned_tts': aligned_tts,
+        'transcribe_options': transcribe_options or default_transcribe_options(),
+        'whisper_model': whisper_model,
+        'accuracy_tier': accuracy_tier,
+        'use_cache': use_cache,
+        'targets': [list(target) for target in targets],
+        # Con varios destinos: un solo MP4 con una pista de audio por destino
+        'multi_audio': multi_audio,
+        'names': names,
+        'timings': {},
+        'keys': {},
+        'cached': [],
+        'completed': [],
+    }
+
+# Cada etapa recibe el dict del trabajo y le agrega sus resultados,
+# así se pueden encadenar en serie (process_video) o en paralelo (staged_pipeline).
+# Con use_cache, cada etapa calcula su clave a partir de la clave de la etapa
+# anterior y sus propios parámetros, y se saltea si el artefacto ya existe.
+
+STAGES = ['transcripcion', 'traduccion', 'voz', 'mezcla', 'informe']
+
+def run_stage(job, name, func, checkpoint=None):
+    """Run one stage unless a previous (interrupted) run already completed it."""
+    if name in job['completed']:
+        return False
+    label = f"{job.get('job_id', job['tag'])}-{name}"
+    with tracing.job_trace(job), tracing.span(f"etapa.{name}"), tracing.profile(name, label):
+        func(job)
+    job['completed'].append(name)
+    if checkpoint:
+        checkpoint(job, name)
+    return True
+
+def _stage_key(job, stage, *parts):
+    if not job['use_cache']:
+        return None
+    key = make_key(stage, *parts)
+    job['keys'][stage] = key
+    return key
+
+def ensure_source_audio(job):
+    # El audio se decodifica una sola vez a 16 kHz mono y queda disponible en
+    # job['source_audio'] para cualquier etapa que lo necesite. Es PCM float32 (~230 MB
+    # por hora): va a un directorio temporal, no al de salida, y se borra con release_source_audio
+    if not job.get('source_audio') or not os.path.exists(job['source_audio']):
+        from media import extract_audio
+        job['source_audio'] = os.path.join(tempfile.mkdtemp(prefix='doblado-audio-'), 'audio_en.f32')
+        extract_audio(job['video_path'], job['source_audio'])
+    return job['source_audio']
+
+def release_source_audio(job):
+    audio_path = job.pop('source_audio', None)
+    if audio_path:
+        shutil.rmtree(os.path.dirname(audio_path), ignore_errors=True)
+
+def run_transcription(job, models):
+    # 1. Transcripción
+    cache = get_artifact_cache()
+    if job['use_cache']:
+        job['input_hash'] = file_digest(job['video_path'])
+    key = _stage_key(job, 'transcripcion', job.get('input_hash'), job['whisper_model'],
+                     job['accuracy_tier'], job['transcribe_options'])
+    data = cache.get_json(key) if key else None
+    if data:
+        job['segments'] = [SimpleNamespace(**seg) for seg in data['segments']]
+        job['whisper_model_used'] = data['model']
+        job['cached'].append('transcripcion')
+        return
+    from media import load_audio
+    from chunked_transcription import is_long, transcribe_long
+    try:
+        audio_path = ensure_source_audio(job)
+        audio = load_audio(audio_path)
+        duration = len(audio) / 16000
+        # El tamaño del modelo se elige por duración y nivel de precisión si es 'auto'
+        size = job['whisper_model']
+        if size == 'auto':
+            size = select_model_size(duration, job['accuracy_tier'])
+        job['whisper_model_used'] = size
+        options = job['transcribe_options']
+        if is_long(duration, options):
+            # Grabaciones largas: pedazos cortados en silencios, transcriptos en paralelo
+            job['segments'] = transcribe_long(models, size, audio_path, options)
+        else:
+            with models.model(size) as model:
+                job['segments'] = transcribe(model, audio, options)
+    finally:
+        # La transcripción es la única etapa que lee el audio original
+        release_source_audio(job)
+    if key:
+        segments = [{'start': seg.start, 'end': seg.end, 'text': seg.text} for seg in job['segments']]
+        cache.put(key, data={'segments': segments, 'model': size})
+
+def translation_stage(job, language):
+    # El idioma del destino principal conserva el nombre de etapa (y la clave de cache) de siempre
+    return 'traduccion' if language == job_targets(job)[0][0] else f"traduccion.{language}"
+
+def target_segments(job, language):
+    if translation_stage(job, language) == 'traduccion':
+        return job['translated_segments']
+    return job['translations'][language]['segments']
+
+def target_srt(job, language):
+    if translation_stage(job, language) == 'traduccion':
+        return job['names']['srt']
+    return job['translations'][language]['srt_path']
+
+def run_translation(job):
+    # 2. Traducción: una vez por idioma, en paralelo (es-AR y es-MX comparten la traducción)
+    languages = list(dict.fromkeys(language for language, _ in job_targets(job)))
+    job.setdefault('translations', {})
+    for_each(lambda language: translate_target(job, language), languages)
+
+def translate_target(job, language):
+    cache = get_artifact_cache()
+    stage = translation_stage(job, language)
+    primary = stage == 'traduccion'
+    srt_path = job['names']['srt'] if primary else dub_names(job['name'], job['output_dir'], language)['srt']
+    provider = select_provider(job['deepl_api_key'], job.get('translator'))
+    # La versión del glosario cambia con sus archivos: invalida solo las traducciones cacheadas
+    key = _stage_key(job, stage, job['keys'].get('transcripcion'), provider_key(provider, 'en', language), 'en',
+                     language, get_glossary().version if language == 'es' else None)
+    data = cache.get_json(key) if key else None
+    if data and cache.restore(key, 'subtitulos.srt', srt_path):
+        segments = data['translated_segments']
+        job['cached'].append(stage)
+    else:
+        segments = translate_segments(job['segments'], job['deepl_api_key'], provider, language)
+        # 3. Generar Subtítulos
+        create_srt(segments, srt_path)
+        if key:
+            cache.put(key, data={'translated_segments': segments}, files={'subtitulos.srt': srt_path})
+    if primary:
+        job['translated_segments'] = segments
+    else:
+        job['translations'][language] = {'segments': segments, 'srt_path': srt_path}
+
+def run_voice_over(job):
+    # 4. Generar Audio: una pista por destino, sintetizadas en paralelo
+    targets = job_targets(job)
+    job.setdefault('dubs', {})
+    words_paths = for_each(lambda target: voice_target(job, target, primary=target == targets[0]), targets)
+    # 5. Generar Avatar (opcional), con la voz del destino principal
+    cache = get_artifact_cache()
+    job['avatar_path'] = None
+    if job['generate_avatar']:
+        from generate_lip_sync import generate_lip_sync_data, LIP_SYNC_VERSION
+        from create_video import create_avatar_video
+        from create_avatar import atlas_key
+        key = _stage_key(job, 'avatar', job['keys'].get('voz'), LIP_SYNC_VERSION, atlas_key(job.get('avatar_size')))
+        if key and cache.restore(key, 'avatar.mp4', job['names']['avatar']):
+            job['cached'].append('avatar')
+        else:
+            lip_sync_file = os.path.join(job['output_dir'], f"lip_sync_{job['tag']}.npz")
+            # Los fonemas van dentro de los intervalos reales de cada palabra del audio doblado;
+            # sin palabras (cache viejo) se reparten en los tiempos de los segmentos
+            words = None
+            if words_paths[0]:
+                with open(words_paths[0], 'r', encoding='utf-8') as f:
+                    words = json.load(f)
+            generate_lip_sync_data(words or job['translated_segments'], lip_sync_file)
+            create_avatar_video(lip_sync_file, job['audio_path'], job['names']['avatar'], size=job.get('avatar_size'))
+            if key:
+                cache.put(key, files={'avatar.mp4': job['names']['avatar']})
+        job['avatar_path'] = job['names']['avatar']
+
+def voice_target(job, target, primary=False):
+    """Synthesize the track of one target; return the path of its words, if any."""
+    cache = get_artifact_cache()
+    language, voice = target
+    suffix = language if primary else target_id(target)
+    stage = 'voz' if primary else f"voz.{target_id(target)}"
+    audio_output_path = os.path.join(job['output_dir'], f"temp_audio_{suffix}_{job['tag']}.mp3")
+    # Palabras de la voz con sus tiempos reales (eventos WordBoundary de edge-tts)
+    words_path = os.path.join(job['output_dir'],
+                              f"palabras_{job['tag']}.json" if primary else f"palabras_{suffix}_{job['tag']}.json")
+    key = _stage_key(job, stage, job['keys'].get(translation_stage(job, language)), voice, job['aligned_tts'])
+    if key and cache.restore(key, 'voz.mp3', audio_output_path):
+        job['cached'].append(stage)
+        if not cache.restore(key, 'palabras.json', words_path):
+            words_path = None
+    else:
+        words = asyncio.run(generate_voice_over(target_segments(job, language), audio_output_path,
+                                                aligned=job['aligned_tts'], voice=voice))
+        with open(words_path, 'w', encoding='utf-8') as f:
+            json.dump(words, f, ensure_ascii=False)
+        if key:
+            cache.put(key, files={'voz.mp3': audio_output_path, 'palabras.json': words_path})
+    if primary:
+        job['audio_path'] = audio_output_path
+    else:
+        job['dubs'][target_id(target)] = {
+            'language': language,
+            'voice': voice,
+            'audio_path': audio_output_path,
+            'srt_path': target_srt(job, language),
+            'video_path': None if job.get('multi_audio') else dub_names(job['name'], job['output_dir'],
+                                                                           target_id(target))['video'],
+        }
+    return words_path
+
+def run_mux(job):
+    # 6. Mezclar: un video por destino en paralelo, o uno solo con todas las pistas
+    targets = job_targets(job)
+    if job.get('multi_audio') and len(targets) > 1:
+        mux_all_tracks(job)
+        return
+    for_each(lambda target: mux_target(job, target, primary=target == targets[0]), targets)
+
+def mux_target(job, target, primary=False):
+    cache = get_artifact_cache()
+    stage = 'mezcla' if primary else f"mezcla.{target_id(target)}"
+    voice_stage = 'voz' if primary else f"voz.{target_id(target)}"
+    dub = None if primary else job['dubs'][target_id(target)]
+    audio_path = job['audio_path'] if primary else dub['audio_path']
+    output_path = job['names']['video'] if primary else dub['video_path']
+    key = _stage_key(job, stage, job.get('input_hash'), job['keys'].get(voice_stage))
+    if key and cache.restore(key, 'video.mp4', output_path):
+        job['cached'].append(stage)
+        return
+    mux_video(job['video_path'], audio_path, output_path)
+    if key:
+        cache.put(key, files={'video.mp4': output_path})
+
+def mux_all_tracks(job):
+    from media import mux_audio_tracks
+    cache = get_artifact_cache()
+    targets = job_targets(job)
+    voice_stages = ['voz'] + [f"voz.{target_id(target)}" for target in targets[1:]]
+    key = _stage_key(job, 'mezcla', job.get('input_hash'), 'pistas', [job['keys'].get(stage) for stage in voice_stages])
+    if key and cache.restore(key, 'video.mp4', job['names']['video']):
+        job['cached'].append('mezcla')
+        return
+    audio_paths = [job['audio_path']] + [job['dubs'][target_id(target)]['audio_path'] for target in targets[1:]]
+    tracks = [(audio_path, AUDIO_LANGUAGES.get(language), target_id((language, voice)))
+              for audio_path, (language, voice) in zip(audio_paths, targets)]
+    mux_audio_tracks(job['video_path'], tracks, job['names']['video'])
+    if key:
+        cache.put(key, files={'video.mp4': job['names']['video']})
+
+def partial_report_path(job):
+    return os.path.join(job['output_dir'], f"informe_parcial_{job['tag']}.md")
+
+def partial_report_writer(path, interval=1.0):
+    # El informe llega en streaming: lo volcamos a disco cada tanto para que la
+    # interfaz lo muestre mientras se genera
+    last = [0.0]
+
+    def write(markdown):
+        now = time.monotonic()
+        if now - last[0] < interval:
+            return
+        last[0] = now
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(markdown)
+        os.replace(tmp_path, path)
+    return write
+
+def ensure_chat_index(job, rebuild=False):
+    """Build the chatbot search index of the job next to its artifacts."""
+    # Los trabajos guardados antes de existir el índice no tienen su nombre
+    path = job['names'].get('index') or output_names(job['name'], job['output_dir'])['index']
+    if rebuild or not os.path.exists(path):
+        ChatIndex.for_video(job['name'], job['translated_segments'], job.get('report_md')).save(path)
+    job['index_path'] = path
+    return path
+
+def run_report(job):
+    cache = get_artifact_cache()
+    # Generate report
+    key = _stage_key(job, 'informe', job['keys'].get('traduccion'), REPORT_MODEL)
+    data = cache.get_json(key) if key else None
+    if data:
+        job['report_md'] = data['report_md']
+        job['cached'].append('informe')
+    else:
+        texts = [seg['text'] for seg in job['translated_segments']]
+        partial_path = partial_report_path(job)
+        job['report_md'] = generate_report(texts, segments=job['translated_segments'],
+                                           on_update=partial_report_writer(partial_path))
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        # Los informes de respaldo (sin API o con error) no se guardan para reintentar la próxima vez
+        if key and os.getenv('OPEN_ROUTE_API') and not job['report_md'].startswith('Error generando'):
+            cache.put(key, data={'report_md': job['report_md']})
+    ensure_chat_index(job, rebuild=True)
+    # Generate JSON
+    key = _stage_key(job, 'json', job['keys'].get('informe'), job['name'], JSON_FORMAT_VERSION)
+    data = cache.get_json(key) if key else None
+    if data:
+        job['json_data'] = data['json_data']
+        job['cached'].append('json')
+        return
+    with open(job['names']['srt'], 'r', encoding='utf-8') as f:
+        srt_content = f.read()
+    job['json_data'] = generate_json(job['segments'], job['translated_segments'], job['report_md'],
+                                     srt_content, job['name'])
+    if key and os.getenv('OPEN_ROUTE_API') and '"error"' not in job['json_data'][:200]:
+        cache.put(key, data={'json_data': job['json_data']})
+
+def job_result(job):
+    return {
+        'name': job['name'],
+        'video_path': job['names']['video'],
+        'srt_path': job['names']['srt'],
+        'report_md': job['report_md'],
+        'report_name': job['names']['report'],
+        'json_data': job['json_data'],
+        'json_name': job['names']['json'],
+        'avatar_path': job['avatar_path'],
+        'trace': tracing.trace_document(job),
+        'index_path': job.get('index_path'),
+        # Los trabajos guardados antes de existir las trazas no tienen este nombre
+        'trace_name': job['names'].get('trace') or output_names(job['name'])['trace'],
+        # Destinos además del principal: video (None si van como pistas del video principal) y SRT
+        'dubs': [{'target': target_id(target), **job['dubs'][target_id(target)]}
+                 for target in job_targets(job)[1:] if target_id(target) in job.get('dubs', {})],
+    }
+
+def process_video(models, video_path, original_name, output_dir=".", tag=0, **options):
+    """Run transcribe -> translate -> SRT -> TTS -> avatar -> mux -> report for one video.
+
+    ``models`` is a whisper_pool.ModelRegistry.
+    """
+    job = new_job(video_path, original_name, output_dir, tag=tag, **options)
+    run_stage(job, 'transcripcion', lambda job: run_transcription(job, models))
+    run_stage(job, 'traduccion', run_translation)
+    run_stage(job, 'voz', run_voice_over)
+    run_stage(job, 'mezcla', run_mux)
+    run_stage(job, 'informe', run_report)
+    return job_result(job)
@@ -0,0 +1,152 @@
+import time
+import queue
+import threading
+import pipeline
+
+# Pipeline por etapas: cada etapa corre en sus propios hilos y se comunica con la
+# siguiente mediante colas acotadas, así el video N+1 se transcribe mientras el N
+# se traduce y el N-1 se codifica. Las colas acotadas evitan que una etapa rápida
+# acumule trabajos en memoria cuando la siguiente es el cuello de botella.
+
+_DONE = object()
+
+class StageStats:
+    """Accumulates per-stage busy and idle time across all videos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+
+    def _entry(self, stage):
+        return self.stages.setdefault(stage, {'videos': 0, 'busy_seconds': 0.0,
+                                              'idle_seconds': 0.0, 'max_seconds': 0.0})
+
+    def record(self, stage, seconds):
+        with self._lock:
+            entry = self._entry(stage)
+            entry['videos'] += 1
+            entry['busy_seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+
+    def record_idle(self, stage, seconds):
+        with self._lock:
+            self._entry(stage)['idle_seconds'] += seconds
+
+    def summary(self):
+        with self._lock:
+            rows = []
+            for stage, entry in self.stages.items():
+                videos = entry['videos']
+                rows.append({
+                    'stage': stage,
+                    'videos': videos,
+                    'busy_seconds': round(entry['busy_seconds'], 2),
+                    'avg_seconds': round(entry['busy_seconds'] / videos, 2) if videos else 0.0,
+                    'max_seconds': round(entry['max_seconds'], 2),
+                    'idle_seconds': round(entry['idle_seconds'], 2),
+                })
+            return rows
+
+    def bottleneck(self):
+        rows = self.summary()
+        if not rows:
+            return None
+        return max(rows, key=lambda row: row['busy_seconds'])['stage']
+
+def default_stages(models):
+    return [
+        ('transcripcion', lambda job: pipeline.run_transcription(job, models)),
+        ('traduccion', pipeline.run_translation),
+        ('voz', pipeline.run_voice_over),
+        ('mezcla', pipeline.run_mux),
+        ('informe', pipeline.run_report),
+    ]
+
+def _stage_worker(name, func, inbox, outbox, stats, finished, checkpoint):
+    while True:
+        waited = time.perf_counter()
+        job = inbox.get()
+        stats.record_idle(name, time.perf_counter() - waited)
+        if job is _DONE:
+            finished()
+            return
+        # Las etapas ya completadas en una ejecución anterior se saltean
+        if 'error' not in job and name not in job['completed']:
+            started = time.perf_counter()
+            try:
+                pipeline.run_stage(job, name, func, checkpoint)
+            except Exception as e:
+                job['error'] = f"{name}: {e}"
+            elapsed = time.perf_counter() - started
+            job['timings'][name] = round(elapsed, 2)
+            stats.record(name, elapsed)
+        outbox.put(job)
+
+def run_pipelined(jobs, models, stats=None, queue_size=2, workers=None, stages=None, checkpoint=None):
+    """Run jobs through the stages concurrently and yield each job as it finishes.
+
+    ``models`` is the whisper_pool.ModelRegistry used by the transcription stage.
+
+    ``workers`` maps a stage name to its thread count (default 1); the network
+    bound stages (traduccion, informe) are the ones worth widening.
+    ``checkpoint(job, stage)`` is called after every completed stage.
+    """
+    stats = stats if stats is not None else StageStats()
+    stages = stages or default_stages(models)
+    workers = workers or {}
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    results = queue.Queue()
+    outboxes = queues[1:] + [results]
+    threads = []
+
+    for index, (name, func) in enumerate(stages):
+        count = max(1, workers.get(name, 1))
+        next_count = max(1, workers.get(stages[index + 1][0], 1)) if index + 1 < len(stages) else 1
+        remaining = [count]
+        lock = threading.Lock()
+
+        # El último hilo de cada etapa en terminar avisa a la etapa siguiente
+        def finished(remaining=remaining, lock=lock, outbox=outboxes[index], next_count=next_count):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    for _ in range(next_count):
+                        outbox.put(_DONE)
+
+        for _ in range(count):
+            thread = threading.Thread(target=_stage_worker, daemon=True, name=f"etapa-{name}",
+                                      args=(name, func, queues[index], outboxes[index], stats, finished,
+                                            checkpoint))
+            thread.start()
+            threads.append(thread)
+
+    first_count = max(1, workers.get(stages[0][0], 1))
+
+    def feed():
+        for job in jobs:
+            queues[0].put(job)
+        for _ in range(first_count):
+            queues[0].put(_DONE)
+
+    feeder = threading.Thread(target=feed, daemon=True, name="etapa-entrada")
+    feeder.start()
+
+    while True:
+        job = results.get()
+        if job is _DONE:
+            break
+        yield job
+
+    feeder.join()
+    for thread in threads:
+        thread.join()
+
+def format_stats(stats):
+    lines = [f"{'etapa':<14}{'videos':>7}{'ocupado':>10}{'prom':>8}{'max':>8}{'ocioso':>10}"]
+    for row in stats.summary():
+        lines.append(f"{row['stage']:<14}{row['videos']:>7}{row['busy_seconds']:>10}"
+                     f"{row['avg_seconds']:>8}{row['max_seconds']:>8}{row['idle_seconds']:>10}")
+    bottleneck = stats.bottleneck()
+    if bottleneck:
+        lines.append(f"Cuello de botella: {bottleneck}")
+    return "\n".join(lines)
@@ -0,0 +1,317 @@
+import os
+import sys
+import time
+import signal
+import shutil
+import inspect
+import itertools
+import threading
+import functools
+import contextvars
+import subprocess
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Trazas por etapa: cada etapa del pipeline y cada llamada saliente (Whisper,
+# traductores, edge-tts, ffmpeg, OpenRouter) corre dentro de un span que mide
+# tiempo real, tiempo de CPU, pico de memoria, bytes enviados/recibidos y
+# reintentos. Los spans de un trabajo quedan en job['trace'] (exportable como
+# JSON) y se agregan en métricas con formato de texto de Prometheus.
+
+METRICS_PORT = int(os.getenv('DOBLADO_METRICS_PORT', '0'))
+TRACE_LOG = os.getenv('DOBLADO_TRACE_LOG', '').strip().lower() in ('1', 'true', 'si', 'yes')
+# Etapas a perfilar (p. ej. "voz,mezcla") y con qué herramienta: cprofile o py-spy
+PROFILE_STAGES = {stage for stage in os.getenv('DOBLADO_PROFILE_STAGES', '').split(',') if stage}
+PROFILER = os.getenv('DOBLADO_PROFILER', 'cprofile')
+PROFILE_DIR = os.getenv('DOBLADO_PROFILE_DIR', os.path.join(os.getenv('DOBLADO_CACHE_DIR', '.cache'), 'profiles'))
+
+DURATION_BUCKETS = (0.05, 0.25, 1, 5, 15, 60, 300, 1800)
+
+_ids = itertools.count(1)
+_trace = contextvars.ContextVar('doblado_trace', default=None)
+_span = contextvars.ContextVar('doblado_span', default=None)
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KB, macOS bytes
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+def cpu_seconds():
+    # CPU de todo el proceso (los hilos nativos de ctranslate2 y los pools incluidos) más la de
+    # los subprocesos ya terminados (ffmpeg, procesos de Whisper): thread_time solo vería el hilo actual
+    if resource is None:
+        return time.process_time()
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+class Span:
+    """One timed operation; ``peak_rss_mb`` is the process high-water mark at its end.
+
+    ``cpu`` is the CPU time of the whole process and its finished subprocesses
+    while the span was open, so concurrent jobs also count toward it.
+    """
+
+    def __init__(self, name, parent=None, attrs=None):
+        self.id = next(_ids)
+        self.parent = parent
+        self.name = name
+        self.attrs = dict(attrs or {})
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.retries = 0
+        self.error = None
+        self.start = time.time()
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_rss_mb = None
+
+    def to_dict(self):
+        data = {'id': self.id, 'parent': self.parent, 'name': self.name, 'start': round(self.start, 3),
+                'wall_seconds': round(self.wall, 4), 'cpu_seconds': round(self.cpu, 4),
+                'peak_rss_mb': self.peak_rss_mb}
+        for field in ('bytes_out', 'bytes_in', 'retries', 'error'):
+            if getattr(self, field):
+                data[field] = getattr(self, field)
+        if self.attrs:
+            data['attrs'] = self.attrs
+        return data
+
+class Metrics:
+    """Aggregates finished spans by name for the Prometheus endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = {}
+
+    def observe(self, span):
+        self.observe_dict(span.to_dict())
+
+    def observe_dict(self, span):
+        with self._lock:
+            entry = self.spans.setdefault(span['name'], {
+                'count': 0, 'errors': 0, 'wall': 0.0, 'cpu': 0.0, 'bytes_out': 0, 'bytes_in': 0,
+                'retries': 0, 'buckets': [0] * len(DURATION_BUCKETS)})
+            entry['count'] += 1
+            entry['errors'] += 1 if span.get('error') else 0
+            entry['wall'] += span['wall_seconds']
+            entry['cpu'] += span['cpu_seconds']
+            entry['bytes_out'] += span.get('bytes_out', 0)
+            entry['bytes_in'] += span.get('bytes_in', 0)
+            entry['retries'] += span.get('retries', 0)
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if span['wall_seconds'] <= bound:
+                    entry['buckets'][i] += 1
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        lines = []
+        counters = [
+            ('doblado_span_cpu_seconds_total', 'cpu', 'Tiempo de CPU acumulado por span'),
+            ('doblado_span_errors_total', 'errors', 'Spans terminados con error'),
+            ('doblado_span_bytes_sent_total', 'bytes_out', 'Bytes enviados por llamadas salientes'),
+            ('doblado_span_bytes_received_total', 'bytes_in', 'Bytes recibidos por llamadas salientes'),
+            ('doblado_span_retries_total', 'retries', 'Reintentos y cambios de proveedor'),
+        ]
+        with self._lock:
+            spans = {name: dict(entry, buckets=list(entry['buckets'])) for name, entry in self.spans.items()}
+        lines.append('# HELP doblado_span_duration_seconds Tiempo real por span')
+        lines.append('# TYPE doblado_span_duration_seconds histogram')
+        for name, entry in sorted(spans.items()):
+            for bound, count in zip(DURATION_BUCKETS, entry['buckets']):
+                lines.append(f'doblado_span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {count}')
+            lines.append(f'doblado_span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {entry["count"]}')
+            lines.append(f'doblado_span_duration_seconds_sum{{span="{name}"}} {entry["wall"]:.4f}')
+            lines.append(f'doblado_span_duration_seconds_count{{span="{name}"}} {entry["count"]}')
+        for metric, field, help_text in counters:
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} counter')
+            for name, entry in sorted(spans.items()):
+                value = entry[field]
+                lines.append(f'{metric}{{span="{name}"}} {value:.4f}' if isinstance(value, float)
+                             else f'{metric}{{span="{name}"}} {value}')
+        rss = peak_rss_mb()
+        if rss is not None:
+            lines.append('# HELP doblado_process_peak_rss_bytes Pico de memoria residente del proceso')
+            lines.append('# TYPE doblado_process_peak_rss_bytes gauge')
+            lines.append(f'doblado_process_peak_rss_bytes {int(rss * 1024 * 1024)}')
+        return "\n".join(lines) + "\n"
+
+METRICS = Metrics()
+
+@contextmanager
+def job_trace(job):
+    """Collect the spans opened inside the block into job['trace']."""
+    token = _trace.set(job.setdefault('trace', []))
+    try:
+        yield
+    finally:
+        _trace.reset(token)
+
+@contextmanager
+def span(name, **attrs):
+    parent = _span.get()
+    current = Span(name, parent.id if parent else None, attrs)
+    token = _span.set(current)
+    wall_started = time.perf_counter()
+    cpu_started = cpu_seconds()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.wall = time.perf_counter() - wall_started
+        current.cpu = cpu_seconds() - cpu_started
+        current.peak_rss_mb = peak_rss_mb()
+        _span.reset(token)
+        trace = _trace.get()
+        if trace is not None:
+            trace.append(current.to_dict())
+        METRICS.observe(current)
+        if TRACE_LOG:
+            print(f"[traza] {name}: {current.wall:.2f}s (cpu {current.cpu:.2f}s)"
+                  + (f" error: {current.error}" if current.error else ""))
+
+def traced(name):
+    """Decorator that runs the function (sync or async) inside a span."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def add_bytes(sent=0, received=0):
+    current = _span.get()
+    if current is not None:
+        current.bytes_out += sent
+        current.bytes_in += received
+
+def add_retry(count=1):
+    current = _span.get()
+    if current is not None:
+        current.retries += count
+
+def set_attrs(**attrs):
+    current = _span.get()
+    if current is not None:
+        current.attrs.update(attrs)
+
+def propagate(func):
+    """Wrap func so it runs with the caller's trace and parent span in another thread."""
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        # Una copia por llamada: un mismo contexto no puede estar activo en dos hilos
+        return context.copy().run(func, *args, **kwargs)
+    return wrapper
+
+def trace_document(job):
+    """Per-job JSON trace: stage timings plus every recorded span."""
+    return {
+        'job': job.get('name'),
+        'job_id': job.get('job_id'),
+        'timings': job.get('timings', {}),
+        'cached': job.get('cached', []),
+        'spans': job.get('trace', []),
+    }
+
+def summarize(spans):
+    """Aggregate spans by name: calls, wall/CPU seconds, bytes and retries."""
+    rows = {}
+    for item in spans:
+        row = rows.setdefault(item['name'], {'span': item['name'], 'llamadas': 0, 'segundos': 0.0, 'cpu': 0.0,
+                                             'kb_enviados': 0.0, 'kb_recibidos': 0.0, 'reintentos': 0,
+                                             'errores': 0})
+        row['llamadas'] += 1
+        row['segundos'] += item['wall_seconds']
+        row['cpu'] += item['cpu_seconds']
+        row['kb_enviados'] += item.get('bytes_out', 0) / 1024
+        row['kb_recibidos'] += item.get('bytes_in', 0) / 1024
+        row['reintentos'] += item.get('retries', 0)
+        row['errores'] += 1 if item.get('error') else 0
+    for row in rows.values():
+        for field in ('segundos', 'cpu', 'kb_enviados', 'kb_recibidos'):
+            row[field] = round(row[field], 2)
+    return sorted(rows.values(), key=lambda row: -row['segundos'])
+
+# --- PERFILADO ---
+
+@contextmanager
+def profile(stage, label):
+    """Profile the block with cProfile or py-spy when stage is listed in DOBLADO_PROFILE_STAGES."""
+    if stage not in PROFILE_STAGES:
+        yield None
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    if PROFILER == 'py-spy' and shutil.which('py-spy'):
+        # py-spy muestrea todo el proceso mientras dura la etapa
+        path = os.path.join(PROFILE_DIR, f"{label}.speedscope.json")
+        spy = subprocess.Popen(['py-spy', 'record', '--pid', str(os.getpid()), '--format', 'speedscope',
+                                '--output', path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            yield path
+        finally:
+            spy.send_signal(signal.SIGINT)
+            spy.wait(timeout=30)
+        return
+    import cProfile
+    path = os.path.join(PROFILE_DIR, f"{label}.prof")
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as e:
+        # Solo un cProfile puede estar activo a la vez: las etapas concurrentes no se perfilan
+        print(f"No se pudo perfilar {label}: {e}")
+        yield None
+        return
+    try:
+        yield path
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+# --- ENDPOINT DE MÉTRICAS ---
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_response(404)
+            self.end_headers()
+            return
+        payload = METRICS.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+def start_metrics_server(port=None, host='0.0.0.0'):
+    """Serve /metrics in a background thread; returns None if no port is configured."""
+    port = METRICS_PORT if port is None else port
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metricas").start()
+    return server
@@ -0,0 +1,180 @@
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import tracing
+
+# Motor de traducción por lotes: empaqueta varios segmentos por request (separados
+# por saltos de línea), lanza los lotes en paralelo y guarda cada traducción en un
+# cache SQLite, así las re-ejecuciones y las intros/outros repetidas no cuestan nada.
+
+CACHE_DIR = os.getenv('DOBLADO_CACHE_DIR', '.cache')
+
+# Google acepta hasta 5000 caracteres por request; dejamos margen
+MAX_CHARS_PER_REQUEST = 4500
+MAX_CONCURRENT_REQUESTS = 4
+# El modelo local (local_translation.py) no tiene límite por request: recibe el video
+# entero en pocas llamadas y arma sus propios lotes de inferencia
+MAX_CHARS_PER_LOCAL_CALL = 100000
+
+# 'auto' usa DeepL si hay API key y si no Google; 'local' traduce sin red
+TRANSLATION_PROVIDER = os.getenv('DOBLADO_TRANSLATOR', 'auto')
+PROVIDERS = ['auto', 'google', 'deepl', 'local']
+
+class TranslationCache:
+    """On-disk cache of translations keyed by (provider, source, target, text)."""
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(CACHE_DIR, 'translations.sqlite')
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            " provider TEXT, source TEXT, target TEXT, text TEXT, translated TEXT,"
+            " PRIMARY KEY (provider, source, target, text))"
+        )
+        self._conn.commit()
+
+    def get_many(self, provider, source, target, texts):
+        found = {}
+        texts = list(texts)
+        with self._lock:
+            # SQLite limita la cantidad de parámetros por consulta
+            for i in range(0, len(texts), 500):
+                chunk = texts[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text, translated FROM translations WHERE provider=? AND source=? AND target=?"
+                    f" AND text IN ({placeholders})",
+                    [provider, source, target] + chunk,
+                ).fetchall()
+                found.update(rows)
+        return found
+
+    def put_many(self, provider, source, target, pairs):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)",
+                [(provider, source, target, text, translated) for text, translated in pairs],
+            )
+            self._conn.commit()
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_translation_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = TranslationCache()
+        return _default_cache
+
+def select_provider(deepl_api_key=None, provider=None):
+    provider = provider or TRANSLATION_PROVIDER
+    if provider == 'auto':
+        return 'deepl' if deepl_api_key else 'google'
+    if provider == 'deepl' and not deepl_api_key:
+        # Como 'auto' sin clave; pasa también al reanudar, porque la clave no se guarda con el trabajo
+        print("Se eligió DeepL pero no hay clave API (DEEPL_API_KEY); se traduce con Google")
+        return 'google'
+    return provider
+
+def provider_key(provider, source='en', target='es'):
+    # Nombre del proveedor en el cache; el local incluye el modelo
+    if provider == 'local':
+        from local_translation import model_name
+        return f"local:{model_name(source, target)}"
+    return provider
+
+def make_translator(provider, source='en', target='es', deepl_api_key=None):
+    if provider == 'local':
+        from local_translation import LocalTranslator
+        return LocalTranslator(source=source, target=target)
+    from deep_translator import GoogleTranslator, DeeplTranslator
+    if provider == 'deepl':
+        return DeeplTranslator(api_key=deepl_api_key, source=source, target=target)
+    return GoogleTranslator(source=source, target=target)
+
+def pack_batches(texts, max_chars=MAX_CHARS_PER_REQUEST):
+    """Group texts into newline-joined batches no longer than max_chars."""
+    batches = []
+    current = []
+    size = 0
+    for text in texts:
+        extra = len(text) + (1 if current else 0)
+        if current and size + extra > max_chars:
+            batches.append(current)
+            current = []
+            size = 0
+            extra = len(text)
+        current.append(text)
+        size += extra
+    if current:
+        batches.append(current)
+    return batches
+
+class SegmentTranslator:
+    """Translates many segments with few round-trips, a fallback provider and a cache."""
+
+    def __init__(self, deepl_api_key=None, source='en', target='es', cache=None,
+                 max_chars=MAX_CHARS_PER_REQUEST, max_workers=MAX_CONCURRENT_REQUESTS, provider=None):
+        self.source = source
+        self.target = target
+        self.provider = select_provider(deepl_api_key, provider)
+        self.translator = make_translator(self.provider, source, target, deepl_api_key)
+        # El traductor alternativo se crea una sola vez, no en cada error
+        self.fallback_provider = 'google'
+        self.fallback = make_translator(self.fallback_provider, source, target, deepl_api_key)
+        self.cache = cache if cache is not None else get_translation_cache()
+        self.max_chars = max_chars
+        self.max_workers = max_workers
+        if self.provider == 'local':
+            # Pocas llamadas grandes y de a una: el modelo ya usa todos los núcleos
+            self.max_chars = MAX_CHARS_PER_LOCAL_CALL
+            self.max_workers = 1
+
+    def _translate_batch_with(self, translator, batch):
+        text = "\n".join(batch)
+        translated = translator.translate(text)
+        tracing.add_bytes(sent=len(text.encode('utf-8')), received=len((translated or '').encode('utf-8')))
+        lines = translated.split("\n") if translated else []
+        if len(lines) != len(batch):
+            # El proveedor unió o partió líneas: traducimos segmento por segmento
+            lines = translator.translate_batch(batch)
+        return [line.strip() for line in lines]
+
+    def _translate_batch(self, batch):
+        with tracing.span(f"traduccion.{self.provider}", segmentos=len(batch)):
+            try:
+                return self.provider, self._translate_batch_with(self.translator, batch)
+            except Exception:
+                tracing.add_retry()
+                try:
+                    # Un lote del modelo local puede superar lo que acepta un request remoto
+                    translated = []
+                    for part in pack_batches(batch):
+                        translated.extend(self._translate_batch_with(self.fallback, part))
+                    return self.fallback_provider, translated
+                except Exception:
+                    # Si ambos fallan usamos el texto original (y no lo guardamos en cache)
+                    return None, list(batch)
+
+    def translate(self, texts):
+        texts = [" ".join(text.split()) for text in texts]
+        unique = [text for text in dict.fromkeys(texts) if text]
+        known = self.cache.get_many(provider_key(self.provider, self.source, self.target), self.source,
+                                    self.target, unique)
+        pending = [text for text in unique if text not in known]
+        if pending:
+            batches = pack_batches(pending, self.max_chars)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                results = list(pool.map(tracing.propagate(self._translate_batch), batches))
+            for batch, (provider, translated) in zip(batches, results):
+                pairs = list(zip(batch, translated))
+                known.update(pairs)
+                if provider:
+                    self.cache.put_many(provider_key(provider, self.source, self.target), self.source,
+                                        self.target, pairs)
+        return [known.get(text, text) for text in texts]
@@ -0,0 +1,137 @@
+import os
+import json
+import asyncio
+import uuid
+import hashlib
+import numpy as np
+from media import decode_pcm, encode_pcm
+import tracing
+
+# Doblaje alineado: en lugar de sintetizar todo el texto en una sola llamada,
+# cada segmento se sintetiza por separado (en paralelo, con un semáforo) y se
+# ubica en su timestamp de Whisper. Si un clip no entra en su espacio se acelera.
+# edge-tts también manda un evento WordBoundary por palabra: se guardan junto al
+# clip y se trasladan al tiempo de la pista final para sincronizar los labios.
+
+CACHE_DIR = os.path.join(os.getenv('DOBLADO_CACHE_DIR', '.cache'), 'tts')
+
+DEFAULT_VOICE = "es-AR-TomasNeural"
+MAX_CONCURRENT_SYNTH = 8
+SAMPLE_RATE = 24000
+# Más allá de este factor la voz se vuelve ininteligible: el resto del clip se recorta
+MAX_TEMPO = 2.0
+# Offset y Duration de los eventos de edge-tts vienen en unidades de 100 ns
+TICKS_PER_SECOND = 10_000_000
+
+def clip_cache_path(voice, text, cache_dir=CACHE_DIR):
+    digest = hashlib.sha256(f"{voice}\n{text}".encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, digest[:2], f"{digest}.mp3")
+
+def words_path(clip_path):
+    return os.path.splitext(clip_path)[0] + '.words.jsonl'
+
+def read_word_boundaries(path):
+    """Return [(offset_seconds, duration_seconds, text)] from an edge-tts metadata file.
+
+    Returns None if the file does not exist (clips cached before word
+    boundaries were recorded).
+    """
+    if not os.path.exists(path):
+        return None
+    words = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                event = json.loads(line)
+                if event.get('type') == 'WordBoundary':
+                    words.append((event['offset'] / TICKS_PER_SECOND, event['duration'] / TICKS_PER_SECOND,
+                                  event['text']))
+    return words
+
+async def save_with_words(text, voice, audio_path, metadata_path):
+    # Los eventos WordBoundary llegan en el mismo stream que el audio: no cuestan otra llamada
+    import edge_tts
+    communicate = edge_tts.Communicate(text, voice, boundary='WordBoundary')
+    await communicate.save(audio_path, metadata_path)
+
+async def synthesize_clip(text, voice, semaphore, cache_dir=CACHE_DIR):
+    path = clip_cache_path(voice, text, cache_dir)
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    async with semaphore:
+        with tracing.span('tts.clip'):
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            tmp_words_path = f"{words_path(path)}.{uuid.uuid4().hex}.tmp"
+            await save_with_words(text, voice, tmp_path, tmp_words_path)
+            tracing.add_bytes(sent=len(text.encode('utf-8')), received=os.path.getsize(tmp_path))
+            # Primero las palabras: si existe el clip, su metadata también
+            os.replace(tmp_words_path, words_path(path))
+            os.replace(tmp_path, path)
+    return path
+
+def _fit_clip(path, slot_seconds, sample_rate):
+    samples = decode_pcm(path, sample_rate)
+    duration = len(samples) / sample_rate
+    tempo = 1.0
+    if slot_seconds > 0 and duration > slot_seconds:
+        tempo = min(duration / slot_seconds, MAX_TEMPO)
+        samples = decode_pcm(path, sample_rate, tempo=tempo)
+    return samples, tempo
+
+def place_words(seg, clip_words, start, end, tempo):
+    """Move the word boundaries of a clip placed at start (seconds) to track time.
+
+    Words are scaled by the tempo and cut at end. Without boundaries the
+    whole audible clip counts as one interval with the segment text.
+    """
+    if not clip_words:
+        return [{'start': start, 'end': end, 'text': seg['text'].strip()}] if end > start else []
+    words = []
+    for offset, duration, text in clip_words:
+        word_start = start + offset / tempo
+        if word_start >= end:
+            break
+        words.append({'start': word_start, 'end': min(word_start + duration / tempo, end), 'text': text})
+    return words
+
+@tracing.traced('tts.ensamblado')
+def assemble_track(segments, clip_paths, output_path, sample_rate=SAMPLE_RATE, total_duration=None):
+    """Place each clip at its segment start, time-stretching clips that overrun their slot.
+
+    Returns the spoken words with their start/end in track time.
+    """
+    if total_duration is None:
+        total_duration = max((seg['end'] for seg in segments), default=0)
+    track = np.zeros(int(total_duration * sample_rate) + 1, dtype=np.int16)
+    words = []
+    for index, (seg, path) in enumerate(zip(segments, clip_paths)):
+        if path is None:
+            continue
+        # El espacio de un segmento llega hasta el inicio del siguiente
+        if index + 1 < len(segments):
+            slot_end = max(segments[index + 1]['start'], seg['end'])
+        else:
+            slot_end = max(seg['end'], total_duration)
+        samples, tempo = _fit_clip(path, slot_end - seg['start'], sample_rate)
+        start = int(seg['start'] * sample_rate)
+        end = min(start + len(samples), int(slot_end * sample_rate), len(track))
+        if end > start:
+            track[start:end] = samples[:end - start]
+            words.extend(place_words(seg, read_word_boundaries(words_path(path)), start / sample_rate,
+                                     end / sample_rate, tempo))
+    encode_pcm(track, sample_rate, output_path)
+    return words
+
+async def generate_aligned_voice_over(text_segments, output_audio_path, voice=DEFAULT_VOICE,
+                                      max_concurrent=MAX_CONCURRENT_SYNTH, total_duration=None):
+    semaphore = asyncio.Semaphore(max_concurrent)
+    # Los textos repetidos se sintetizan una sola vez
+    texts = list(dict.fromkeys(seg['text'].strip() for seg in text_segments if seg['text'].strip()))
+    paths = await asyncio.gather(*(synthesize_clip(text, voice, semaphore) for text in texts))
+    by_text = dict(zip(texts, paths))
+    clip_paths = [by_text.get(seg['text'].strip()) for seg in text_segments]
+    # Decodificar y estirar es trabajo de CPU/subprocesos: lo sacamos del event loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, tracing.propagate(assemble_track), text_segments, clip_paths,
+                                      output_audio_path, SAMPLE_RATE, total_duration)
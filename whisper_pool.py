@@ -0,0 +1,163 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# Registro de modelos Whisper: mantiene varios tamaños cargados a la vez, elige
+# uno por trabajo según duración y nivel de precisión, los precarga en segundo
+# plano al arrancar y descarga los que no se usan cuando se supera el tope de memoria.
+
+# Memoria aproximada de cada modelo en int8 (MB)
+MODEL_MEMORY_MB = {
+    'tiny': 150,
+    'base': 250,
+    'small': 600,
+    'medium': 1500,
+    'large-v3': 3200,
+}
+
+# Por nivel de precisión: (duración máxima en segundos, tamaño). Los videos más
+# largos bajan un escalón para mantener la latencia acotada.
+TIER_MODELS = {
+    'rapido': [(600, 'base'), (None, 'tiny')],
+    # El nivel por defecto usa el mismo modelo que antes de existir los niveles
+    'equilibrado': [(None, 'base')],
+    'preciso': [(3600, 'medium'), (None, 'small')],
+}
+DEFAULT_TIER = 'equilibrado'
+
+MEMORY_CAP_MB = int(os.getenv('WHISPER_MEMORY_CAP_MB', '4096'))
+IDLE_SECONDS = int(os.getenv('WHISPER_IDLE_SECONDS', '1800'))
+# Por defecto se precarga el que el nivel por defecto elige para un video corto
+PRELOAD_MODELS = [size for size in os.getenv('WHISPER_PRELOAD', TIER_MODELS[DEFAULT_TIER][0][1]).split(',')
+                  if size]
+# Cada cuánto (segundos) se revisan los modelos inactivos aunque no lleguen trabajos nuevos
+EVICT_INTERVAL = 60
+
+def select_model_size(duration, tier=DEFAULT_TIER):
+    for max_duration, size in TIER_MODELS.get(tier, TIER_MODELS[DEFAULT_TIER]):
+        if max_duration is None or duration <= max_duration:
+            return size
+    return 'base'
+
+def select_device():
+    # Precisión automática: float16 en GPU, int8 en CPU
+    device = os.getenv('WHISPER_DEVICE')
+    if not device:
+        try:
+            import ctranslate2
+            device = 'cuda' if ctranslate2.get_cuda_device_count() > 0 else 'cpu'
+        except Exception:
+            device = 'cpu'
+    compute_type = os.getenv('WHISPER_COMPUTE_TYPE') or ('float16' if device == 'cuda' else 'int8')
+    return device, compute_type
+
+class ModelRegistry:
+    """Holds loaded Whisper models keyed by size, with LRU eviction under a memory cap."""
+
+    def __init__(self, cpu_threads=None, num_workers=None, memory_cap_mb=MEMORY_CAP_MB,
+                 idle_seconds=IDLE_SECONDS):
+        cores = os.cpu_count() or 1
+        self.num_workers = num_workers or int(os.getenv('WHISPER_NUM_WORKERS', '1'))
+        # Cada transcripción concurrente recibe su parte de los núcleos
+        self.cpu_threads = cpu_threads or max(1, cores // self.num_workers)
+        # Se resuelven al cargar el primer modelo: importar ctranslate2 no frena el arranque
+        self.device = self.compute_type = None
+        self.memory_cap_mb = memory_cap_mb
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._models = {}
+        self._last_used = {}
+        self._in_use = {}
+        # Los modelos precargados no se descargan por inactividad, solo por el tope de memoria
+        self.pinned = set()
+        self._reaper = None
+
+    def _load(self, size):
+        from faster_whisper import WhisperModel
+        if self.device is None:
+            self.device, self.compute_type = select_device()
+        return WhisperModel(size, device=self.device, compute_type=self.compute_type,
+                            cpu_threads=self.cpu_threads, num_workers=self.num_workers)
+
+    def get(self, size):
+        with self._lock:
+            load_lock = self._load_locks.setdefault(size, threading.Lock())
+        # Un lock por tamaño: dos trabajos que piden el mismo modelo no lo cargan dos veces
+        with load_lock:
+            with self._lock:
+                model = self._models.get(size)
+            if model is None:
+                # Se hace lugar antes de cargar: el tope no se supera ni mientras carga
+                self.evict(keep=size, reserve_mb=MODEL_MEMORY_MB.get(size, 1000))
+                model = self._load(size)
+                with self._lock:
+                    self._models[size] = model
+                    self._start_reaper()
+        with self._lock:
+            self._last_used[size] = time.time()
+        return model
+
+    def _start_reaper(self):
+        # Con self._lock tomado. Sin este hilo, un modelo inactivo solo se descargaría al llegar otro trabajo
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap, daemon=True, name="whisper-evict")
+            self._reaper.start()
+
+    def _reap(self):
+        interval = max(1, min(EVICT_INTERVAL, self.idle_seconds))
+        while True:
+            time.sleep(interval)
+            self.evict()
+
+    @contextmanager
+    def model(self, size):
+        with self._lock:
+            self._in_use[size] = self._in_use.get(size, 0) + 1
+        try:
+            yield self.get(size)
+        finally:
+            with self._lock:
+                self._in_use[size] -= 1
+                self._last_used[size] = time.time()
+
+    def loaded(self):
+        with self._lock:
+            return sorted(self._models)
+
+    def memory_mb(self):
+        with self._lock:
+            return sum(MODEL_MEMORY_MB.get(size, 1000) for size in self._models)
+
+    def evict(self, keep=None, reserve_mb=0):
+        """Unload idle models past the idle timeout, then LRU ones while over the memory cap.
+
+        reserve_mb is the memory of a model about to be loaded.
+        """
+        now = time.time()
+        with self._lock:
+            idle = sorted((size for size in self._models if not self._in_use.get(size) and size != keep),
+                          key=lambda size: self._last_used.get(size, 0))
+            total = reserve_mb + sum(MODEL_MEMORY_MB.get(size, 1000) for size in self._models)
+            for size in idle:
+                expired = size not in self.pinned and now - self._last_used.get(size, 0) > self.idle_seconds
+                if expired or total > self.memory_cap_mb:
+                    total -= MODEL_MEMORY_MB.get(size, 1000)
+                    del self._models[size]
+
+    def preload_async(self, sizes=None):
+        sizes = PRELOAD_MODELS if sizes is None else sizes
+        with self._lock:
+            self.pinned.update(sizes)
+
+        def preload():
+            for size in sizes:
+                try:
+                    self.get(size)
+                except Exception as e:
+                    print(f"No se pudo precargar el modelo Whisper '{size}': {e}")
+
+        thread = threading.Thread(target=preload, daemon=True, name="whisper-preload")
+        thread.start()
+        return thread